@@ -0,0 +1,104 @@
+"""
+Benchmark of the NER stage: per-page throughput and peak memory of the spaCy
+pipeline for different models and component selections.
+
+Every configuration runs in a fresh process so that its RSS is measured on
+its own. Usage:
+
+    python benchmark_ner.py teaser1.pdf teaser2.pdf [--models en_core_web_md en_core_web_sm]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import queue
+import resource
+import time
+from typing import Dict, List, Optional
+
+from parser.pdf_parser import PDFParser, shutdown_executors
+from parser.nlp import NLP_EXCLUDE
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_configuration(model: str, exclude: List[str], texts: List[str], pages: int, results) -> None:
+    from parser.nlp import NLPProcessor
+
+    load_started = time.perf_counter()
+    processor = NLPProcessor(model, exclude=exclude, disable=[])
+    load_seconds = time.perf_counter() - load_started
+    rss_after_load = _peak_rss_mb()
+
+    started = time.perf_counter()
+    entity_count = 0
+    for text in texts:
+        entity_count += sum(len(entities) for entities in processor.extract_entities(text).values())
+    seconds = time.perf_counter() - started
+
+    results.put({
+        "load_seconds": load_seconds,
+        "pages_per_second": pages / seconds if seconds else 0.0,
+        "entities": entity_count,
+        "rss_after_load_mb": rss_after_load,
+        "peak_rss_mb": _peak_rss_mb(),
+        "components": processor.nlp.pipe_names,
+    })
+
+
+def run_benchmark(model: str, exclude: List[str], texts: List[str], pages: int) -> Optional[Dict]:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_configuration, args=(model, exclude, texts, pages, results))
+    process.start()
+    # Consume the result before joining: a child that has put data on a queue
+    # doesn't exit until the data is read
+    result = None
+    while result is None and (process.is_alive() or not results.empty()):
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            pass
+    process.join()
+    return result if process.exitcode == 0 else None
+
+
+async def _load_texts(paths: List[str]):
+    texts = []
+    pages = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            extraction = await PDFParser.extract_pages(f.read())
+        texts.append(extraction.text)
+        pages += len(extraction.pages)
+    return texts, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spaCy NER on teaser PDFs")
+    parser.add_argument("pdfs", nargs="+", help="PDF files to extract entities from")
+    parser.add_argument("--models", nargs="+", default=["en_core_web_md", "en_core_web_sm"])
+    args = parser.parse_args()
+
+    texts, pages = asyncio.run(_load_texts(args.pdfs))
+    shutdown_executors()
+    print(f"Benchmarking on {len(texts)} documents, {pages} pages, {sum(len(t) for t in texts)} characters\n")
+
+    print(f"{'model':<20} {'pipeline':<10} {'load s':>8} {'pages/s':>9} {'entities':>9} {'RSS load MB':>12} {'RSS peak MB':>12}")
+    for model in args.models:
+        for label, exclude in (("full", []), ("ner-only", NLP_EXCLUDE)):
+            result = run_benchmark(model, exclude, texts, pages)
+            if result is None:
+                print(f"{model:<20} {label:<10} failed (is the model installed?)")
+                continue
+            print(
+                f"{model:<20} {label:<10} {result['load_seconds']:>8.2f} {result['pages_per_second']:>9.1f} "
+                f"{result['entities']:>9} {result['rss_after_load_mb']:>12.0f} {result['peak_rss_mb']:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Cancellation of in-flight teaser processing.
+
+Every queued job carries the run token stored on its teaser (Teaser.run_id).
+Cancelling or re-processing a teaser replaces the token, which makes jobs of
+the old run stale: queued ones are skipped when they start, and running ones
+stop before their next stage. To stop a running job right away, the API
+announces the cancelled run on a channel. Every worker process keeps a
+registry of the pipeline tasks it is running and cancels the matching one,
+which aborts pending OCR chunks and the in-flight OpenAI request.
+"""
+
+import asyncio
+from typing import Dict, Optional, Tuple
+
+from progress import get_redis
+
+# Channel on which cancelled runs are announced to all workers
+CANCELLATION_CHANNEL = "teaser-cancellations"
+
+
+async def request_cancellation(teaser_id: int, run_id: Optional[str]):
+    """Ask whichever worker is processing the given run of the teaser to stop"""
+    await get_redis().publish(CANCELLATION_CHANNEL, f"{teaser_id}:{run_id or ''}")
+
+
+class CancellationRegistry:
+    """
+    Maps teaser ids to the run and pipeline task running in this process and
+    cancels the task when its run is announced as cancelled.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[int, Tuple[Optional[str], asyncio.Task]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    def register(self, teaser_id: int, run_id: Optional[str], task: asyncio.Task):
+        self._tasks[teaser_id] = (run_id, task)
+
+    def unregister(self, teaser_id: int, task: asyncio.Task):
+        if teaser_id in self._tasks and self._tasks[teaser_id][1] is task:
+            del self._tasks[teaser_id]
+
+    def cancel(self, teaser_id: int, run_id: Optional[str]) -> bool:
+        """
+        Cancel the local task of a teaser's run, returns False if that run
+        isn't running here. Jobs queued without a run token match any run.
+        """
+        if teaser_id not in self._tasks:
+            return False
+        running_run_id, task = self._tasks[teaser_id]
+        if task.done() or (running_run_id is not None and running_run_id != run_id):
+            return False
+        print(f"Cancelling processing of teaser {teaser_id}")
+        task.cancel()
+        return True
+
+    def ensure_listening(self):
+        """Start listening for cancellation requests on the running event loop"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.ensure_future(self._listen())
+
+    async def _listen(self):
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.subscribe(CANCELLATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        teaser_id, _, run_id = message["data"].decode("utf-8").partition(":")
+                        self.cancel(int(teaser_id), run_id or None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Cancellation listener failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
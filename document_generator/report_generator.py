@@ -1,5 +1,7 @@
 import os
+import asyncio
 import datetime
+import functools
 import logging
 import json
 from typing import Dict, Optional, Any, List
@@ -135,9 +137,13 @@ class ReportGenerator:
                     page_number_text = f"Page {doc_obj.page}"
                     canvas_obj.drawRightString(555, 25, page_number_text)
 
-                # Build the PDF with the custom page template
+                # Build the PDF with the custom page template, on a thread so that
+                # the event loop keeps serving the other teasers meanwhile
                 logger.info("Building PDF document")
-                doc.build(elements, onFirstPage=add_page_template, onLaterPages=add_page_template)
+                await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    functools.partial(doc.build, elements, onFirstPage=add_page_template, onLaterPages=add_page_template)
+                )
 
                 logger.info(f"Successfully generated report at {report_path}")
                 return report_path
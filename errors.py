@@ -0,0 +1,15 @@
+"""
+Exceptions shared by the pipeline and the parsers it runs.
+
+Kept free of other imports so that the parser worker processes can raise
+and unpickle them without loading the database or redis clients.
+"""
+
+
+class TransientPipelineError(Exception):
+    """
+    A stage failed for a reason worth retrying (rate limit, network error,
+    a crashed worker process). The teaser stays in processing so that a
+    retry can resume from the last checkpoint.
+    """
+    pass
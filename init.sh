@@ -7,4 +7,7 @@ mkdir -p reports
 # Install the reportlab package if not already installed
 pip install reportlab==4.0.5
 
+# Bring the database schema up to date
+alembic upgrade head
+
 echo "Backend initialization complete!"
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Job queue shared by the API and the worker tier.
+
+The API enqueues jobs by task name only, so it doesn't import the pipeline
+and runs without the worker dependencies (spaCy, pdfplumber, tesseract,
+ReportLab).
+"""
+
+import os
+from typing import List, Optional
+
+from celery import Celery
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
+CELERY_CONCURRENCY = int(os.getenv("CELERY_CONCURRENCY", "4"))
+CELERY_MAX_RETRIES = int(os.getenv("CELERY_MAX_RETRIES", "3"))
+
+# Name of the task running a teaser through the pipeline (see worker.py)
+PROCESS_TEASER_TASK = "teasers.process"
+
+celery_app = Celery("teaser_worker", broker=CELERY_BROKER_URL)
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    task_ignore_result=True,
+    task_default_queue="teasers",
+    # Only acknowledge a job once it has finished so that it is redelivered
+    # to another worker if this one dies mid-processing
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+    # Thread pool: pipeline work is mostly awaiting the OpenAI API, and the
+    # CPU-heavy parts are free to spawn their own processes from here
+    worker_pool=os.getenv("CELERY_POOL", "threads"),
+    worker_concurrency=CELERY_CONCURRENCY,
+)
+
+
+def enqueue_teaser_processing(
+    teaser_id: int,
+    selected_blocks: Optional[List[str]] = None,
+    restart_from: Optional[str] = None,
+    run_id: Optional[str] = None
+):
+    """
+    Queue a teaser for processing by the workers.
+
+    Args:
+        teaser_id: The ID of the teaser to process
+        selected_blocks: Optional list of building block IDs to include in the processing
+        restart_from: Optional pipeline stage to run again, together with the stages depending on it
+        run_id: Token of the run, the job is skipped once the teaser has moved on to another run
+    """
+    celery_app.send_task(PROCESS_TEASER_TASK, args=[teaser_id, selected_blocks, restart_from, run_id])
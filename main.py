@@ -1,23 +1,32 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, BackgroundTasks, Response, status
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload
+from typing import List, Optional
+from datetime import datetime
 import os
+import hashlib
+import json
+import base64
+import uuid
 from dotenv import load_dotenv
 import models
 import schemas
 from models import TeaserStatus
-from database import get_db, engine
-from parser.pdf_parser import PDFParser
-from parser.nlp import NLPProcessor
-from pipeline.simple_openai.teaser_pipeline import SimpleOpenAIPipeline
+from database import engine, get_db
+from jobs import enqueue_teaser_processing
+from storage import save_upload, upload_path
+from progress import get_redis, publish_progress, stream_progress
+from cancellation import request_cancellation
 
 # Load environment variables
 load_dotenv()
 
-# Create tables in the database
-models.Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic migrations (alembic upgrade head), run
+# as a separate deployment step so that starting the API issues no DDL
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -44,35 +53,84 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize NLP processor
-nlp_processor = NLPProcessor()
-
 # Create reports directory if it doesn't exist
 os.makedirs("reports", exist_ok=True)
 
-# Background task for processing PDFs
-async def process_pdf(file_content: bytes, filename: str, db: Session):
-    # Extract text from PDF
-    extracted_text = await PDFParser.extract_text_from_pdf(file_content)
-    
-    # Update teaser with extracted text
-    db_teaser = db.query(models.Teaser).filter(models.Teaser.filename == filename).order_by(models.Teaser.id.desc()).first()
+@app.get("/health/live")
+async def liveness():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Readiness probe: the database and redis (job queue and progress events)
+    are reachable. Returns 503 while any of them is not.
+    """
+    checks = {}
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        checks["database"] = "ok"
+    except Exception as e:
+        checks["database"] = f"unavailable: {e}"
+    try:
+        await get_redis().ping()
+        checks["redis"] = "ok"
+    except Exception as e:
+        checks["redis"] = f"unavailable: {e}"
     
-    if db_teaser:
-        db_teaser.extracted_text = extracted_text
-        db_teaser.status = TeaserStatus.PROCESSING
-        db.commit()
-        db.refresh(db_teaser)
-        
-        # Start the pipeline processing
-        pipeline = SimpleOpenAIPipeline(db, nlp_processor)
-        await pipeline.process(db_teaser.id)
+    ready = all(check == "ok" for check in checks.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "not ready", "checks": checks}
+    )
+
+async def _get_teaser(db: AsyncSession, teaser_id: int, fields=schemas.TEASER_FIELDS) -> Optional[models.Teaser]:
+    """
+    Load a teaser with the given TeaserResponse fields. Narrow columns come
+    from the teasers row, payloads are eagerly loaded from their own tables
+    only when requested.
+    """
+    columns = [field for field in fields if field not in models.Teaser.PAYLOAD_RELATIONSHIPS]
+    payloads = [models.Teaser.PAYLOAD_RELATIONSHIPS[field] for field in fields if field in models.Teaser.PAYLOAD_RELATIONSHIPS]
+    query = (
+        select(models.Teaser)
+        .options(
+            load_only(*[getattr(models.Teaser, field) for field in columns]),
+            *[selectinload(getattr(models.Teaser, relationship)) for relationship in payloads]
+        )
+        .where(models.Teaser.id == teaser_id)
+        .execution_options(populate_existing=True)
+    )
+    return (await db.execute(query)).scalars().first()
+
+async def _enqueue_processing(db: AsyncSession, teaser: models.Teaser, *args, **kwargs):
+    """
+    Queue a teaser for the workers without blocking the event loop on the
+    broker. The job gets a new run token, which turns jobs of earlier runs
+    still queued or running into no-ops. If the job can't be queued the
+    teaser is marked as failed, so that it can be processed again later,
+    and 503 is returned.
+    """
+    teaser.run_id = str(uuid.uuid4())
+    await db.commit()
+    try:
+        await run_in_threadpool(enqueue_teaser_processing, teaser.id, *args, run_id=teaser.run_id, **kwargs)
+    except Exception as e:
+        print(f"Could not queue teaser {teaser.id} for processing: {e}")
+        teaser.status = TeaserStatus.ERROR
+        teaser.run_id = None
+        await db.commit()
+        await publish_progress(teaser.id, "error", detail="Could not queue the teaser for processing")
+        raise HTTPException(status_code=503, detail="Processing queue unavailable, please retry later")
 
 @app.post("/upload", response_model=schemas.TeaserResponse)
 async def upload_teaser(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Upload a PDF teaser file for parsing and analysis.
@@ -84,44 +142,147 @@ async def upload_teaser(
     # Read file content
     file_content = await file.read()
     
+    content_hash = hashlib.sha256(file_content).hexdigest()
+    
     # Create a teaser in the database with processing status
     db_teaser = models.Teaser(
         filename=file.filename,
+        content_hash=content_hash,
         status=TeaserStatus.PROCESSING
     )
+    
+    # If the same PDF was uploaded before, reuse its extracted text and entities
+    duplicate = (await db.execute(
+        select(models.Teaser)
+        .options(selectinload(models.Teaser.document), selectinload(models.Teaser.entity_rows))
+        .where(models.Teaser.content_hash == content_hash, models.Teaser.document.has())
+        .order_by(models.Teaser.id.desc())
+        .limit(1)
+    )).scalars().first()
+    if duplicate:
+        db_teaser.extracted_text = duplicate.extracted_text
+        db_teaser.entities = duplicate.entities
+    
     db.add(db_teaser)
-    db.commit()
-    db.refresh(db_teaser)
+    await db.commit()
     
-    # Process the PDF in the background
-    background_tasks.add_task(process_pdf, file_content, file.filename, db)
+    # Hand the PDF over to the worker tier for processing
+    await save_upload(db_teaser.id, file_content)
+    await publish_progress(db_teaser.id, "queued")
+    if duplicate:
+        print(f"Teaser {db_teaser.id} is a duplicate of teaser {duplicate.id}, skipping extraction")
+    await _enqueue_processing(db, db_teaser)
     
-    return db_teaser
+    return await _get_teaser(db, db_teaser.id)
+
+def _encode_cursor(teaser: models.Teaser) -> str:
+    payload = json.dumps({"created_at": teaser.created_at.isoformat(), "id": teaser.id})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(payload["created_at"]), int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.get("/teasers", response_model=schemas.TeaserList)
-async def get_teasers(db: Session = Depends(get_db)):
+async def get_teasers(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status_filter: Optional[TeaserStatus] = Query(None, alias="status"),
+    filename: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Get all teasers from the database.
+    List teasers, newest first, one page at a time.
+    
+    Only the lightweight columns are loaded. Pass the returned next_cursor as
+    cursor to fetch the following page; it is None on the last page.
     """
-    teasers = db.query(models.Teaser).all()
-    return {"teasers": teasers}
+    query = select(models.Teaser).options(load_only(
+        models.Teaser.id,
+        models.Teaser.filename,
+        models.Teaser.status,
+        models.Teaser.created_at,
+        models.Teaser.updated_at,
+    ))
+    
+    if status_filter is not None:
+        query = query.where(models.Teaser.status == status_filter)
+    if filename:
+        # Match % and _ in the input literally rather than as wildcards
+        pattern = filename.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.where(models.Teaser.filename.ilike(f"%{pattern}%", escape="\\"))
+    if cursor:
+        created_at, teaser_id = _decode_cursor(cursor)
+        query = query.where(tuple_(models.Teaser.created_at, models.Teaser.id) < tuple_(created_at, teaser_id))
+    
+    # Fetch one extra row to know whether there is a next page
+    query = query.order_by(models.Teaser.created_at.desc(), models.Teaser.id.desc()).limit(limit + 1)
+    teasers = (await db.execute(query)).scalars().all()
+    next_cursor = _encode_cursor(teasers[limit - 1]) if len(teasers) > limit else None
+    
+    return {"teasers": teasers[:limit], "next_cursor": next_cursor}
 
-@app.get("/teasers/{teaser_id}", response_model=schemas.TeaserResponse)
-async def get_teaser(teaser_id: int, db: Session = Depends(get_db)):
+@app.get("/teasers/{teaser_id}", response_model=None, responses={200: {"model": schemas.TeaserResponse}})
+async def get_teaser(
+    teaser_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. status,report_path"),
+    db: AsyncSession = Depends(get_db)
+):
     """
     Get a specific teaser by ID.
+    
+    With fields, only the requested columns are loaded from the database and
+    returned, so status checks don't touch the document, entity and section
+    tables.
     """
-    teaser = db.query(models.Teaser).filter(models.Teaser.id == teaser_id).first()
+    response_model = schemas.TeaserResponse
+    selected_fields = schemas.TEASER_FIELDS
+    if fields:
+        try:
+            selected_fields = schemas.parse_teaser_fields(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        response_model = schemas.teaser_fields_model(selected_fields)
+    
+    teaser = await _get_teaser(db, teaser_id, selected_fields)
     if teaser is None:
         raise HTTPException(status_code=404, detail="Teaser not found")
-    return teaser
+    return response_model.model_validate(teaser)
+
+@app.get("/teasers/{teaser_id}/events")
+async def get_teaser_events(teaser_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Stream processing progress of a teaser as server-sent events.
+    """
+    teaser = await _get_teaser(db, teaser_id, ("id", "status"))
+    if teaser is None:
+        raise HTTPException(status_code=404, detail="Teaser not found")
+    
+    # Nothing left to follow, report the final status and close
+    if teaser.status != TeaserStatus.PROCESSING:
+        final_event = json.dumps({"teaser_id": teaser_id, "stage": teaser.status.value})
+        
+        async def final_status():
+            yield f"data: {final_event}\n\n"
+        events = final_status()
+    else:
+        events = stream_progress(teaser_id, request)
+    
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/teasers/{teaser_id}/report")
-async def get_teaser_report(teaser_id: int, db: Session = Depends(get_db)):
+async def get_teaser_report(teaser_id: int, db: AsyncSession = Depends(get_db)):
     """
     Download the generated report for a teaser.
     """
-    teaser = db.query(models.Teaser).filter(models.Teaser.id == teaser_id).first()
+    teaser = await _get_teaser(db, teaser_id, ("id", "filename", "status", "report_path"))
     if teaser is None:
         raise HTTPException(status_code=404, detail="Teaser not found")
     
@@ -139,11 +300,11 @@ async def get_teaser_report(teaser_id: int, db: Session = Depends(get_db)):
     )
 
 @app.delete("/teasers/{teaser_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_teaser(teaser_id: int, db: Session = Depends(get_db)):
+async def delete_teaser(teaser_id: int, db: AsyncSession = Depends(get_db)):
     """
     Delete a specific teaser by ID.
     """
-    teaser = db.query(models.Teaser).filter(models.Teaser.id == teaser_id).first()
+    teaser = await _get_teaser(db, teaser_id, ("id", "report_path"))
     if teaser is None:
         raise HTTPException(status_code=404, detail="Teaser not found")
     
@@ -151,9 +312,13 @@ async def delete_teaser(teaser_id: int, db: Session = Depends(get_db)):
     if teaser.report_path and os.path.exists(teaser.report_path):
         os.remove(teaser.report_path)
     
-    # Delete the teaser from the database
-    db.delete(teaser)
-    db.commit()
+    # Delete the uploaded PDF as well
+    if os.path.exists(upload_path(teaser.id)):
+        os.remove(upload_path(teaser.id))
+    
+    # Delete the teaser from the database; its payload rows go with it (ON DELETE CASCADE)
+    await db.delete(teaser)
+    await db.commit()
     
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -161,13 +326,12 @@ async def delete_teaser(teaser_id: int, db: Session = Depends(get_db)):
 async def process_teaser(
     teaser_id: int,
     process_request: schemas.TeaserProcessRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Start processing a teaser with selected building blocks.
     """
-    teaser = db.query(models.Teaser).filter(models.Teaser.id == teaser_id).first()
+    teaser = await _get_teaser(db, teaser_id)
     if teaser is None:
         raise HTTPException(status_code=404, detail="Teaser not found")
     
@@ -177,24 +341,28 @@ async def process_teaser(
     
     # Update teaser status to PROCESSING
     teaser.status = models.TeaserStatus.PROCESSING
-    db.commit()
-    db.refresh(teaser)
+    await db.commit()
     
-    # Start the pipeline processing with selected building blocks
-    pipeline = TeaserProcessingPipeline(db, nlp_processor)
-    background_tasks.add_task(pipeline.process, teaser_id, process_request.building_blocks)
+    # Queue the pipeline processing with selected building blocks; the
+    # extracted text and entities are kept, analysis and report run again
+    await publish_progress(teaser_id, "queued")
+    await _enqueue_processing(db, teaser, process_request.building_blocks, restart_from="analysis")
     
     return teaser
 
 @app.post("/teasers/{teaser_id}/cancel", response_model=schemas.TeaserResponse)
 async def cancel_teaser_processing(
     teaser_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Cancel processing of a teaser.
+    
+    The worker running the teaser stops its OCR and OpenAI work; a job that
+    is still queued is skipped when it starts, since its run is no longer
+    the teaser's current one.
     """
-    teaser = db.query(models.Teaser).filter(models.Teaser.id == teaser_id).first()
+    teaser = await _get_teaser(db, teaser_id, schemas.TEASER_FIELDS + ("run_id",))
     if teaser is None:
         raise HTTPException(status_code=404, detail="Teaser not found")
     
@@ -202,10 +370,13 @@ async def cancel_teaser_processing(
     if teaser.status != models.TeaserStatus.PROCESSING:
         raise HTTPException(status_code=400, detail="Only processing teasers can be canceled")
     
-    # Update teaser status to ERROR
-    teaser.status = models.TeaserStatus.ERROR
-    db.commit()
-    db.refresh(teaser)
+    # Update teaser status to CANCELLED, retire its run and stop the running job
+    run_id = teaser.run_id
+    teaser.status = models.TeaserStatus.CANCELLED
+    teaser.run_id = None
+    await db.commit()
+    await request_cancellation(teaser_id, run_id)
+    await publish_progress(teaser_id, "cancelled")
     
     print(f"Processing canceled for teaser {teaser_id}")
     
@@ -213,4 +384,4 @@ async def cancel_teaser_processing(
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,41 @@
+"""Initial schema, as created by create_all before migrations were introduced
+
+Databases created that way can be brought under Alembic with
+`alembic stamp 0001` followed by `alembic upgrade head`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "teasers",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("extracted_text", sa.Text(), nullable=True),
+        sa.Column("entities", sa.JSON(), nullable=True),
+        sa.Column("gpt_analysis", sa.JSON(), nullable=True),
+        sa.Column("status", sa.Enum("PROCESSING", "COMPLETED", "ERROR", name="teaserstatus"), nullable=False),
+        sa.Column("report_path", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_teasers_id", "teasers", ["id"])
+
+
+def downgrade():
+    op.drop_index("ix_teasers_id", table_name="teasers")
+    op.drop_table("teasers")
+    sa.Enum(name="teaserstatus").drop(op.get_bind(), checkfirst=True)
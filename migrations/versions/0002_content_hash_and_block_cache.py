@@ -0,0 +1,44 @@
+"""Content hash on teasers and the per-block GPT analysis cache
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("teasers", sa.Column("content_hash", sa.String(length=64), nullable=True))
+    op.create_index("ix_teasers_content_hash", "teasers", ["content_hash"])
+
+    op.create_table(
+        "llm_block_cache",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("text_hash", sa.String(length=64), nullable=False),
+        sa.Column("block_id", sa.String(), nullable=False),
+        sa.Column("prompt_version", sa.String(), nullable=False),
+        sa.Column("model", sa.String(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("text_hash", "block_id", "prompt_version", "model", name="uq_llm_block_cache_key"),
+    )
+    op.create_index("ix_llm_block_cache_id", "llm_block_cache", ["id"])
+    op.create_index("ix_llm_block_cache_text_hash", "llm_block_cache", ["text_hash"])
+
+
+def downgrade():
+    op.drop_index("ix_llm_block_cache_text_hash", table_name="llm_block_cache")
+    op.drop_index("ix_llm_block_cache_id", table_name="llm_block_cache")
+    op.drop_table("llm_block_cache")
+
+    op.drop_index("ix_teasers_content_hash", table_name="teasers")
+    op.drop_column("teasers", "content_hash")
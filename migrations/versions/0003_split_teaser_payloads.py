@@ -0,0 +1,131 @@
+"""Move extracted text, entities and GPT sections into their own tables
+
+Existing data is copied over; documents are stored uncompressed.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "teaser_documents",
+        sa.Column("teaser_id", sa.Integer(), nullable=False),
+        sa.Column("content", sa.LargeBinary(), nullable=False),
+        sa.Column("compressed", sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(["teaser_id"], ["teasers.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("teaser_id"),
+    )
+    op.create_table(
+        "teaser_entities",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("teaser_id", sa.Integer(), nullable=False),
+        sa.Column("category", sa.String(), nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("label", sa.String(), nullable=False),
+        sa.Column("start_char", sa.Integer(), nullable=False),
+        sa.Column("end_char", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["teaser_id"], ["teasers.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_teaser_entities_teaser_id", "teaser_entities", ["teaser_id"])
+    op.create_table(
+        "teaser_sections",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("teaser_id", sa.Integer(), nullable=False),
+        sa.Column("block_name", sa.String(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["teaser_id"], ["teasers.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("teaser_id", "block_name", name="uq_teaser_sections_block"),
+    )
+    op.create_index("ix_teaser_sections_teaser_id", "teaser_sections", ["teaser_id"])
+
+    # Copy the inline payloads into the new tables
+    op.execute("""
+        INSERT INTO teaser_documents (teaser_id, content, compressed)
+        SELECT id, convert_to(extracted_text, 'UTF8'), false
+        FROM teasers
+        WHERE extracted_text IS NOT NULL
+    """)
+    op.execute("""
+        INSERT INTO teaser_entities (teaser_id, category, text, label, start_char, end_char)
+        SELECT t.id, c.key, e.value ->> 'text', e.value ->> 'label',
+               (e.value ->> 'start_char')::int, (e.value ->> 'end_char')::int
+        FROM teasers t,
+             json_each(t.entities) WITH ORDINALITY AS c(key, value, category_position),
+             json_array_elements(c.value) WITH ORDINALITY AS e(value, entity_position)
+        WHERE t.entities IS NOT NULL
+        ORDER BY t.id, c.category_position, e.entity_position
+    """)
+    op.execute("""
+        INSERT INTO teaser_sections (teaser_id, block_name, content, position)
+        SELECT t.id, s.key, coalesce(s.value #>> '{}', ''), s.position - 1
+        FROM teasers t,
+             json_each(t.gpt_analysis) WITH ORDINALITY AS s(key, value, position)
+        WHERE t.gpt_analysis IS NOT NULL
+    """)
+
+    op.drop_column("teasers", "gpt_analysis")
+    op.drop_column("teasers", "entities")
+    op.drop_column("teasers", "extracted_text")
+
+
+def downgrade():
+    op.add_column("teasers", sa.Column("extracted_text", sa.Text(), nullable=True))
+    op.add_column("teasers", sa.Column("entities", sa.JSON(), nullable=True))
+    op.add_column("teasers", sa.Column("gpt_analysis", sa.JSON(), nullable=True))
+
+    # Compressed documents can only be restored from Python
+    connection = op.get_bind()
+    documents = connection.execute(sa.text("SELECT teaser_id, content, compressed FROM teaser_documents"))
+    for teaser_id, content, compressed in documents.fetchall():
+        text = (zlib.decompress(content) if compressed else bytes(content)).decode("utf-8")
+        connection.execute(
+            sa.text("UPDATE teasers SET extracted_text = :text WHERE id = :id"),
+            {"text": text, "id": teaser_id},
+        )
+    op.execute("""
+        UPDATE teasers t SET entities = grouped.entities
+        FROM (
+            SELECT teaser_id, json_object_agg(category, items ORDER BY first_id) AS entities
+            FROM (
+                SELECT teaser_id, category, min(id) AS first_id,
+                       json_agg(json_build_object(
+                           'text', text, 'label', label, 'start_char', start_char, 'end_char', end_char
+                       ) ORDER BY id) AS items
+                FROM teaser_entities
+                GROUP BY teaser_id, category
+            ) categories
+            GROUP BY teaser_id
+        ) grouped
+        WHERE t.id = grouped.teaser_id
+    """)
+    op.execute("""
+        UPDATE teasers t SET gpt_analysis = grouped.sections
+        FROM (
+            SELECT teaser_id, json_object_agg(block_name, content ORDER BY position) AS sections
+            FROM teaser_sections
+            GROUP BY teaser_id
+        ) grouped
+        WHERE t.id = grouped.teaser_id
+    """)
+
+    op.drop_index("ix_teaser_sections_teaser_id", table_name="teaser_sections")
+    op.drop_table("teaser_sections")
+    op.drop_index("ix_teaser_entities_teaser_id", table_name="teaser_entities")
+    op.drop_table("teaser_entities")
+    op.drop_table("teaser_documents")
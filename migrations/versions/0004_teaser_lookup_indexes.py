@@ -0,0 +1,26 @@
+"""Indexes for filename, status and created_at lookups on teasers
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_teasers_filename", "teasers", ["filename"])
+    op.create_index("ix_teasers_created_at_id", "teasers", ["created_at", "id"])
+    op.create_index("ix_teasers_status_created_at_id", "teasers", ["status", "created_at", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_teasers_status_created_at_id", table_name="teasers")
+    op.drop_index("ix_teasers_created_at_id", table_name="teasers")
+    op.drop_index("ix_teasers_filename", table_name="teasers")
@@ -0,0 +1,32 @@
+"""Add the CANCELLED teaser status
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-16
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # New enum values can't be added inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE teaserstatus ADD VALUE IF NOT EXISTS 'CANCELLED'")
+
+
+def downgrade():
+    # Postgres can't drop enum values; map cancelled teasers back to ERROR
+    # and recreate the type without it
+    op.execute("UPDATE teasers SET status = 'ERROR' WHERE status = 'CANCELLED'")
+    op.execute("ALTER TYPE teaserstatus RENAME TO teaserstatus_old")
+    op.execute("CREATE TYPE teaserstatus AS ENUM ('PROCESSING', 'COMPLETED', 'ERROR')")
+    op.execute("DROP INDEX IF EXISTS ix_teasers_status_created_at_id")
+    op.execute("ALTER TABLE teasers ALTER COLUMN status TYPE teaserstatus USING status::text::teaserstatus")
+    op.execute("CREATE INDEX ix_teasers_status_created_at_id ON teasers (status, created_at, id)")
+    op.execute("DROP TYPE teaserstatus_old")
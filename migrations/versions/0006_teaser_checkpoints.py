@@ -0,0 +1,34 @@
+"""Pipeline stage checkpoints
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "teaser_checkpoints",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("teaser_id", sa.Integer(), nullable=False),
+        sa.Column("stage", sa.String(), nullable=False),
+        sa.Column("completed_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.ForeignKeyConstraint(["teaser_id"], ["teasers.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("teaser_id", "stage", name="uq_teaser_checkpoints_stage"),
+    )
+    op.create_index("ix_teaser_checkpoints_teaser_id", "teaser_checkpoints", ["teaser_id"])
+
+
+def downgrade():
+    op.drop_index("ix_teaser_checkpoints_teaser_id", table_name="teaser_checkpoints")
+    op.drop_table("teaser_checkpoints")
@@ -0,0 +1,32 @@
+"""Trigram index for substring search on teaser filenames
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-16
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The listing filters with ILIKE '%...%', which the btree index can't serve
+    op.drop_index("ix_teasers_filename", table_name="teasers")
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_teasers_filename_trgm",
+        "teasers",
+        ["filename"],
+        postgresql_using="gin",
+        postgresql_ops={"filename": "gin_trgm_ops"},
+    )
+
+
+def downgrade():
+    op.drop_index("ix_teasers_filename_trgm", table_name="teasers")
+    op.create_index("ix_teasers_filename", "teasers", ["filename"])
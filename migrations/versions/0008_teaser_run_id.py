@@ -0,0 +1,23 @@
+"""Run token on teasers
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("teasers", sa.Column("run_id", sa.String(36), nullable=True))
+
+
+def downgrade():
+    op.drop_column("teasers", "run_id")
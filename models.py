@@ -1,23 +1,195 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, UniqueConstraint, LargeBinary, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from typing import Dict, List, Optional
 import enum
+import os
+import zlib
 from database import Base
 
+# Store extracted teaser text zlib-compressed
+COMPRESS_TEASER_TEXT = os.getenv("COMPRESS_TEASER_TEXT", "true").lower() == "true"
+
 class TeaserStatus(str, enum.Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     ERROR = "error"
+    CANCELLED = "cancelled"
 
 class Teaser(Base):
     __tablename__ = "teasers"
+    __table_args__ = (
+        # Keyset pagination of the listing, unfiltered and filtered by status
+        Index("ix_teasers_created_at_id", "created_at", "id"),
+        Index("ix_teasers_status_created_at_id", "status", "created_at", "id"),
+        # Substring search on the filename (ILIKE '%...%') can't use a btree index
+        Index(
+            "ix_teasers_filename_trgm", "filename",
+            postgresql_using="gin", postgresql_ops={"filename": "gin_trgm_ops"},
+        ),
+    )
+    # Fetch server-generated timestamps on insert/update, they can't be lazily loaded under asyncio
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
-    extracted_text = Column(Text, nullable=True)
-    entities = Column(JSON, nullable=True)
-    gpt_analysis = Column(JSON, nullable=True)  # Store the structured MECE analysis from GPT
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the uploaded PDF
     status = Column(Enum(TeaserStatus), default=TeaserStatus.PROCESSING, nullable=False)
     report_path = Column(String, nullable=True)
+    # Token of the latest queued processing run; jobs of older runs are stale
+    # and stop without touching the teaser
+    run_id = Column(String(36), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Heavy payloads live in their own tables and are only loaded when accessed
+    document = relationship("TeaserDocument", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+    entity_rows = relationship("TeaserEntity", order_by="TeaserEntity.id", cascade="all, delete-orphan", passive_deletes=True)
+    sections = relationship("TeaserSection", order_by="TeaserSection.position", cascade="all, delete-orphan", passive_deletes=True)
+
+    # Relationship backing each of the composed payload attributes
+    PAYLOAD_RELATIONSHIPS = {
+        "extracted_text": "document",
+        "entities": "entity_rows",
+        "gpt_analysis": "sections",
+    }
+
+    @property
+    def extracted_text(self) -> Optional[str]:
+        return self.document.text if self.document else None
+
+    @extracted_text.setter
+    def extracted_text(self, value: Optional[str]):
+        if value is None:
+            self.document = None
+        elif self.document:
+            self.document.text = value
+        else:
+            self.document = TeaserDocument(text=value)
+
+    @property
+    def entities(self) -> Optional[Dict[str, List[Dict]]]:
+        """Entities grouped by category, as produced by NLPProcessor.extract_entities"""
+        if not self.entity_rows:
+            return None
+        entities = {}
+        for row in self.entity_rows:
+            entities.setdefault(row.category, []).append({
+                "text": row.text,
+                "label": row.label,
+                "start_char": row.start_char,
+                "end_char": row.end_char
+            })
+        return entities
+
+    @entities.setter
+    def entities(self, value: Optional[Dict[str, List[Dict]]]):
+        self.entity_rows = [
+            TeaserEntity(
+                category=category,
+                text=entity["text"],
+                label=entity["label"],
+                start_char=entity["start_char"],
+                end_char=entity["end_char"]
+            )
+            for category, category_entities in (value or {}).items()
+            for entity in category_entities
+        ]
+
+    @property
+    def gpt_analysis(self) -> Optional[Dict[str, str]]:
+        """The structured MECE analysis from GPT, keyed by section name"""
+        if not self.sections:
+            return None
+        return {section.block_name: section.content for section in self.sections}
+
+    @gpt_analysis.setter
+    def gpt_analysis(self, value: Optional[Dict[str, str]]):
+        # Update sections in place so that their (teaser_id, block_name) keys stay unique
+        existing = {section.block_name: section for section in self.sections}
+        sections = []
+        for position, (block_name, content) in enumerate((value or {}).items()):
+            section = existing.get(block_name) or TeaserSection(block_name=block_name)
+            section.content = content
+            section.position = position
+            sections.append(section)
+        self.sections = sections
+
+    def set_section(self, block_name: str, content: str):
+        """Add or replace a single section of the analysis"""
+        for section in self.sections:
+            if section.block_name == block_name:
+                section.content = content
+                return
+        self.sections.append(TeaserSection(block_name=block_name, content=content, position=len(self.sections)))
+
+class TeaserDocument(Base):
+    """Extracted text of a teaser, optionally compressed"""
+    __tablename__ = "teaser_documents"
+
+    teaser_id = Column(Integer, ForeignKey("teasers.id", ondelete="CASCADE"), primary_key=True)
+    content = Column(LargeBinary, nullable=False)
+    compressed = Column(Boolean, nullable=False, default=False)
+
+    @property
+    def text(self) -> str:
+        data = zlib.decompress(self.content) if self.compressed else self.content
+        return data.decode("utf-8")
+
+    @text.setter
+    def text(self, value: str):
+        data = value.encode("utf-8")
+        self.compressed = COMPRESS_TEASER_TEXT
+        self.content = zlib.compress(data) if COMPRESS_TEASER_TEXT else data
+
+class TeaserEntity(Base):
+    """A named entity found in a teaser"""
+    __tablename__ = "teaser_entities"
+
+    id = Column(Integer, primary_key=True)
+    teaser_id = Column(Integer, ForeignKey("teasers.id", ondelete="CASCADE"), nullable=False, index=True)
+    category = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    label = Column(String, nullable=False)
+    start_char = Column(Integer, nullable=False)
+    end_char = Column(Integer, nullable=False)
+
+class TeaserSection(Base):
+    """Analysis of one building block of a teaser"""
+    __tablename__ = "teaser_sections"
+    __table_args__ = (
+        UniqueConstraint("teaser_id", "block_name", name="uq_teaser_sections_block"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    teaser_id = Column(Integer, ForeignKey("teasers.id", ondelete="CASCADE"), nullable=False, index=True)
+    block_name = Column(String, nullable=False)
+    content = Column(Text, nullable=False, default="")
+    position = Column(Integer, nullable=False, default=0)
+
+class LLMBlockCache(Base):
+    """GPT analysis of one building block, keyed by the exact input it was produced from"""
+    __tablename__ = "llm_block_cache"
+    __table_args__ = (
+        UniqueConstraint("text_hash", "block_id", "prompt_version", "model", name="uq_llm_block_cache_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    text_hash = Column(String(64), nullable=False, index=True)  # SHA-256 of the extracted text
+    block_id = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+
+class TeaserCheckpoint(Base):
+    """Completion of one pipeline stage for a teaser"""
+    __tablename__ = "teaser_checkpoints"
+    __table_args__ = (
+        UniqueConstraint("teaser_id", "stage", name="uq_teaser_checkpoints_stage"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    teaser_id = Column(Integer, ForeignKey("teasers.id", ondelete="CASCADE"), nullable=False, index=True)
+    stage = Column(String, nullable=False)
+    completed_at = Column(DateTime(timezone=True), server_default=func.now())
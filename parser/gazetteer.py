@@ -0,0 +1,148 @@
+import json
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+# Optional JSON file extending the built-in term lists, with any of the keys
+# "legal_suffixes", "generic_suffixes", "sponsors" and "industries" mapping
+# to lists of terms
+NLP_GAZETTEER_PATH = os.getenv("NLP_GAZETTEER_PATH")
+
+# Longest company name (in tokens) in front of a legal suffix
+MAX_NAME_TOKENS = 5
+
+LEGAL_SUFFIXES = [
+    "Inc", "Incorporated", "Corp", "Corporation", "Ltd", "Limited", "LLC", "LLP", "LP",
+    "PLC", "GmbH", "AG", "KG", "KGaA", "SE", "SA", "SAS", "SARL", "S.p.A.", "SpA", "Srl",
+    "BV", "NV", "Pty", "Oyj", "ASA",
+]
+
+# Suffixes that are also ordinary words in teasers ("the Group", "the Company").
+# They only mark an ORG entity found by the NER as a company, the gazetteer
+# doesn't look for names in front of them on its own
+GENERIC_SUFFIXES = ["Co", "Company", "Group", "Holding", "Holdings"]
+
+SPONSORS = [
+    "3i", "Advent International", "Apax Partners", "Apollo Global Management", "Ardian",
+    "Bain Capital", "BC Partners", "Blackstone", "Bridgepoint", "Brookfield", "Carlyle",
+    "Cinven", "Clayton Dubilier & Rice", "CVC Capital Partners", "EQT", "General Atlantic",
+    "Hellman & Friedman", "HgCapital", "Hg", "Inflexion", "KKR", "Kohlberg Kravis Roberts",
+    "Leonard Green", "Montagu", "Nordic Capital", "PAI Partners", "Partners Group", "Permira",
+    "Silver Lake", "TA Associates", "Thoma Bravo", "TPG", "Triton", "Vista Equity Partners",
+    "Warburg Pincus",
+]
+
+INDUSTRIES = [
+    "aerospace", "agriculture", "asset management", "automotive", "banking", "biotechnology",
+    "building materials", "business services", "chemicals", "construction", "consumer goods",
+    "cybersecurity", "defense", "e-commerce", "education", "energy", "engineering",
+    "facility management", "fintech", "food and beverage", "healthcare", "hospitality",
+    "industrial automation", "information technology", "insurance", "logistics",
+    "manufacturing", "media", "medical devices", "mining", "packaging", "pharmaceuticals",
+    "real estate", "renewable energy", "retail", "SaaS", "semiconductors", "software",
+    "specialty chemicals", "telecommunications", "transportation", "utilities", "waste management",
+]
+
+
+def normalize_suffix(text: str) -> str:
+    """Normalize a legal suffix for lookup, e.g. "S.p.A." -> "spa", "Ltd." -> "ltd" """
+    return text.replace(".", "").replace(",", "").lower()
+
+
+def load_terms(path: Optional[str] = NLP_GAZETTEER_PATH) -> Dict[str, List[str]]:
+    """Return the built-in term lists, extended by the JSON file at path if given"""
+    terms = {
+        "legal_suffixes": list(LEGAL_SUFFIXES),
+        "generic_suffixes": list(GENERIC_SUFFIXES),
+        "sponsors": list(SPONSORS),
+        "industries": list(INDUSTRIES),
+    }
+    if path:
+        with open(path) as f:
+            for key, values in json.load(f).items():
+                if key not in terms:
+                    raise ValueError(f"Unknown gazetteer list '{key}' in {path}")
+                terms[key].extend(values)
+    return terms
+
+
+class Gazetteer:
+    """
+    Dictionary-based tagger for company names and industries.
+
+    Sponsors and industry terms are compiled once into a case-insensitive
+    spaCy PhraseMatcher, which finds all of them in a single pass over a
+    Doc. Company names ending in a legal suffix ("Acme Industrial GmbH")
+    are found in the same pass over the tokens. This catches companies the
+    statistical NER misses without a bigger model.
+    """
+
+    def __init__(self, nlp, terms: Optional[Dict[str, List[str]]] = None):
+        from spacy.matcher import PhraseMatcher
+
+        terms = terms or load_terms()
+        self.legal_suffixes: Set[str] = {normalize_suffix(suffix) for suffix in terms["legal_suffixes"]}
+        self.generic_suffixes: Set[str] = {normalize_suffix(suffix) for suffix in terms["generic_suffixes"]}
+        self.matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+        # Patterns only need tokenizing, not the rest of the pipeline
+        self.matcher.add("SPONSOR", list(nlp.tokenizer.pipe(terms["sponsors"])))
+        self.matcher.add("INDUSTRY", list(nlp.tokenizer.pipe(terms["industries"])))
+
+    def has_legal_suffix(self, span) -> bool:
+        """Whether a span (e.g. an ORG entity) ends in a legal or generic suffix"""
+        if len(span) < 2:
+            return False
+        suffix = normalize_suffix(span[-1].text)
+        return suffix in self.legal_suffixes or suffix in self.generic_suffixes
+
+    def match(self, doc) -> List[Tuple[str, object]]:
+        """
+        Return (label, span) pairs for sponsors ("SPONSOR"), companies with a
+        legal suffix ("LEGAL_ENTITY") and industry terms ("INDUSTRY") in the
+        doc, without overlaps (longer matches win).
+        """
+        from spacy.tokens import Span
+        from spacy.util import filter_spans
+
+        spans = [
+            Span(doc, start, end, label=match_id)
+            for match_id, start, end in self.matcher(doc)
+        ]
+        spans.extend(self._legal_entities(doc))
+        return [(span.label_, span) for span in filter_spans(spans)]
+
+    def _legal_entities(self, doc):
+        """
+        Spans of capitalized words followed by a legal suffix, e.g. "Acme
+        Industrial GmbH". The name stops at stop words ("Highlights of the
+        GmbH") and line breaks, and all-caps runs are skipped as headings.
+        """
+        from spacy.tokens import Span
+
+        spans = []
+        for token in doc:
+            # Suffixes written in lower case are ordinary words
+            if token.is_lower or normalize_suffix(token.text) not in self.legal_suffixes:
+                continue
+            start = token.i
+            while start > 0 and token.i - start < MAX_NAME_TOKENS and _is_name_token(doc[start - 1]):
+                start -= 1
+            # A name doesn't start with a connector
+            while start < token.i and doc[start].text == "&":
+                start += 1
+            if start == token.i:
+                continue
+            # "OVERVIEW OF ACME SA" is a heading; a single acronym ("BASF SE") is a name
+            name = doc[start:token.i]
+            if len(name) > 1 and all(t.is_upper or t.text == "&" for t in name):
+                continue
+            spans.append(Span(doc, start, token.i + 1, label="LEGAL_ENTITY"))
+        return spans
+
+
+def _is_name_token(token) -> bool:
+    if token.text == "&":
+        return True
+    # Names don't run across stop words ("of", "the") or line breaks
+    if token.is_stop or token.is_space or "\n" in token.whitespace_:
+        return False
+    return (token.is_title or token.is_upper) and not token.is_punct
@@ -1,20 +1,129 @@
-import spacy
-from typing import Dict, List, Tuple
+import os
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from errors import TransientPipelineError
+from parser.gazetteer import Gazetteer
+from parser.pools import POOL_CONTEXT
+
+# Number of processes running NER, each holding its own copy of the model;
+# 0 runs it on a thread of the calling process instead. Every Celery worker
+# process owns its own pool, so by default it gets one NER process per job it
+# runs concurrently (CELERY_CONCURRENCY, see jobs.py), capped at the number of
+# cores. Each process holds a few hundred MB of model: with several worker
+# processes per host, lower this to cores / worker processes.
+NER_WORKERS = int(os.getenv(
+    "NER_WORKERS",
+    str(min(os.cpu_count() or 1, int(os.getenv("CELERY_CONCURRENCY", "4"))))
+))
+# Documents of concurrent teasers are batched together: at most this many per
+# batch, waiting at most this long for more to arrive
+NER_MAX_BATCH_DOCS = int(os.getenv("NER_MAX_BATCH_DOCS", "8"))
+NER_BATCH_WAIT_SECONDS = float(os.getenv("NER_BATCH_WAIT_SECONDS", "0.05"))
+
+# Texts are split into chunks of at most this many characters, on page and
+# paragraph boundaries, so that peak memory doesn't grow with the document
+NLP_CHUNK_CHARS = int(os.getenv("NLP_CHUNK_CHARS", "20000"))
+# Number of chunks spaCy processes together
+NLP_BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", "8"))
+
+# Boundaries to split on, from most to least preferred: pages/paragraphs, lines, words
+CHUNK_SEPARATORS = ["\n\n", "\n", " "]
+
+def _env_list(name: str, default: str) -> List[str]:
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+# spaCy pipeline to load, e.g. en_core_web_sm for a smaller and faster model
+NLP_MODEL = os.getenv("NLP_MODEL", "en_core_web_md")
+# Only doc.ents is used. The ner component of the en_core_web_* pipelines has
+# its own embedding layer, so everything else is left out of the pipeline
+# (excluded components are never loaded, disabled ones are loaded but not run)
+NLP_EXCLUDE = _env_list("NLP_EXCLUDE", "tok2vec,tagger,parser,attribute_ruler,lemmatizer,senter")
+NLP_DISABLE = _env_list("NLP_DISABLE", "")
+# Optional JSONL file of entity_ruler patterns, matched ahead of the statistical NER
+NLP_ENTITY_PATTERNS = os.getenv("NLP_ENTITY_PATTERNS")
+# Tag companies and industries from the gazetteer (parser/gazetteer.py) as well
+NLP_GAZETTEER = os.getenv("NLP_GAZETTEER", "true").lower() == "true"
 
 class NLPProcessor:
-    def __init__(self):
+    def __init__(
+        self,
+        model: str = NLP_MODEL,
+        exclude: Optional[List[str]] = None,
+        disable: Optional[List[str]] = None,
+        entity_patterns: Optional[str] = NLP_ENTITY_PATTERNS,
+        gazetteer: bool = NLP_GAZETTEER,
+    ):
+        """
+        Load the spaCy pipeline used for NER.
+        
+        Args:
+            model: Name or path of the spaCy pipeline
+            exclude: Components not to load at all (defaults to NLP_EXCLUDE)
+            disable: Components to load but not run (defaults to NLP_DISABLE)
+            entity_patterns: Optional JSONL file of entity_ruler patterns; matches
+                             take precedence over the statistical NER
+            gazetteer: Whether to tag sponsors, companies with a legal suffix and
+                       industry terms from the gazetteer alongside the NER
+        """
+        # Imported here so that modules using this one load without spaCy installed
+        import spacy
+        
         # Load the spaCy model
-        self.nlp = spacy.load("en_core_web_md")
+        self.nlp = spacy.load(
+            model,
+            exclude=NLP_EXCLUDE if exclude is None else exclude,
+            disable=NLP_DISABLE if disable is None else disable,
+        )
+        
+        if entity_patterns:
+            ruler = self.nlp.add_pipe("entity_ruler", before="ner" if "ner" in self.nlp.pipe_names else None)
+            ruler.from_disk(entity_patterns)
+        
+        # Compiled once, applied to every Doc in a single pass
+        self.gazetteer = Gazetteer(self.nlp) if gazetteer else None
+        
+        print(f"Loaded spaCy pipeline {model} with components {self.nlp.pipe_names}")
     
     def extract_entities(self, text: str) -> Dict[str, List[Dict]]:
         """
         Extract named entities from text using spaCy
         Returns a dictionary with entity categories as keys and lists of entities as values
         """
-        doc = self.nlp(text)
+        return self.extract_entities_batch([text])[0]
+    
+    def extract_entities_batch(self, texts: List[str]) -> List[Dict[str, List[Dict]]]:
+        """
+        Extract named entities from several texts in a single nlp.pipe pass,
+        so that the chunks of short documents are batched together.
+        
+        Returns:
+            List[Dict[str, List[Dict]]]: Entities by category, one dictionary per text
+        """
+        results = [self._empty_categories() for _ in texts]
+        for index, category, entity in self._iter_entities_of_texts(texts):
+            results[index][category].append(entity)
         
-        # Initialize result dictionary
-        entities = {
+        # Filter out empty categories
+        return [{k: v for k, v in entities.items() if v} for entities in results]
+    
+    def iter_entities(self, text: str) -> Iterator[Tuple[str, Dict]]:
+        """
+        Yield (category, entity) pairs in document order.
+        
+        The text is processed chunk by chunk with nlp.pipe, and each chunk's
+        Doc is released once its entities are yielded, so memory stays flat
+        however long the document is. Offsets refer to the original text.
+        """
+        for _, category, entity in self._iter_entities_of_texts([text]):
+            yield category, entity
+    
+    @staticmethod
+    def _empty_categories() -> Dict[str, List[Dict]]:
+        return {
             "COMPANY": [],
             "ORGANIZATION": [],
             "PERSON": [],
@@ -26,7 +135,9 @@ class NLPProcessor:
             "INDUSTRY": [],
             "OTHER": []
         }
-        
+    
+    def _iter_entities_of_texts(self, texts: List[str]) -> Iterator[Tuple[int, str, Dict]]:
+        """Yield (text index, category, entity) for the chunks of all texts"""
         # Map spaCy entity labels to our custom categories
         label_mapping = {
             "ORG": "ORGANIZATION",
@@ -39,24 +150,225 @@ class NLPProcessor:
             "PRODUCT": "INDUSTRY",
         }
         
-        # Extract entities and categorize them
-        for ent in doc.ents:
-            category = label_mapping.get(ent.label_, "OTHER")
+        chunks = (
+            (chunk, (index, offset))
+            for index, text in enumerate(texts)
+            for offset, chunk in split_into_chunks(text, NLP_CHUNK_CHARS)
+        )
+        for doc, (index, offset) in self.nlp.pipe(chunks, as_tuples=True, batch_size=NLP_BATCH_SIZE):
+            matches = self.gazetteer.match(doc) if self.gazetteer else []
+            company_matches = [span for label, span in matches if label in ("SPONSOR", "LEGAL_ENTITY")]
+            
+            chunk_entities = []
             
-            # Try to identify company names (usually organizations)
-            if category == "ORGANIZATION" and any(term in ent.text.lower() for term in ["inc", "corp", "ltd", "llc", "company", "group"]):
-                category = "COMPANY"
+            # Extract entities and categorize them
+            for ent in doc.ents:
+                category = label_mapping.get(ent.label_, "OTHER")
+                
+                # Identify company names (usually organizations)
+                if category == "ORGANIZATION" and self._is_company(ent, company_matches):
+                    category = "COMPANY"
+                
+                # Create entity dictionary, rebased onto the original text
+                chunk_entities.append((category, self._entity(ent, ent.label_, offset)))
             
-            # Create entity dictionary
-            entity = {
-                "text": ent.text,
-                "label": ent.label_,
-                "start_char": ent.start_char,
-                "end_char": ent.end_char
-            }
+            # Gazetteer matches the statistical NER missed
+            for label, span in matches:
+                if any(span.start < ent.end and ent.start < span.end for ent in doc.ents):
+                    continue
+                chunk_entities.append(("INDUSTRY" if label == "INDUSTRY" else "COMPANY", self._entity(span, label, offset)))
             
-            # Add to appropriate category
-            entities[category].append(entity)
+            # Both sources don't overlap, so ordering by start gives document order
+            chunk_entities.sort(key=lambda item: item[1]["start_char"])
+            for category, entity in chunk_entities:
+                yield index, category, entity
+    
+    def _is_company(self, ent, company_matches) -> bool:
+        if self.gazetteer is None:
+            return any(term in ent.text.lower() for term in ["inc", "corp", "ltd", "llc", "company", "group"])
+        return self.gazetteer.has_legal_suffix(ent) or any(
+            span.start < ent.end and ent.start < span.end for span in company_matches
+        )
+    
+    @staticmethod
+    def _entity(span, label: str, offset: int) -> Dict:
+        return {
+            "text": span.text,
+            "label": label,
+            "start_char": offset + span.start_char,
+            "end_char": offset + span.end_char
+        }
+
+def split_into_chunks(text: str, max_chars: int) -> Iterator[Tuple[int, str]]:
+    """
+    Split text into (offset, chunk) pairs of at most max_chars characters.
+    
+    Chunks end on page/paragraph boundaries where possible, then on line
+    breaks and spaces; only a single word longer than max_chars is cut.
+    Joining the chunks gives back the original text.
+    
+    Args:
+        text: The text to split
+        max_chars: Maximum chunk length; 0 or less returns the text as one chunk
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        if text:
+            yield 0, text
+        return
+    
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            for separator in CHUNK_SEPARATORS:
+                boundary = text.rfind(separator, start, end)
+                if boundary > start:
+                    end = boundary + len(separator)
+                    break
+        yield start, text[start:end]
+        start = end
+
+# The model is loaded once per process, on first use
+_processor: Optional[NLPProcessor] = None
+_processor_lock = threading.Lock()
+_ner_executor: Optional[Executor] = None
+
+def get_nlp_processor() -> NLPProcessor:
+    """Return this process's NLPProcessor, loading the model on first use"""
+    global _processor
+    with _processor_lock:
+        if _processor is None:
+            _processor = NLPProcessor()
+    return _processor
+
+def get_ner_executor() -> Optional[Executor]:
+    """
+    Return the process pool used for NER, creating it on first use. Every
+    process loads the model when it starts. Returns None when NER is
+    configured to run on the default thread pool.
+    """
+    global _ner_executor
+    if _ner_executor is None and NER_WORKERS > 0:
+        _ner_executor = ProcessPoolExecutor(
+            max_workers=NER_WORKERS,
+            initializer=get_nlp_processor,
+            mp_context=POOL_CONTEXT,
+        )
+    return _ner_executor
+
+def preload_ner_workers():
+    """
+    Start the NER_WORKERS processes of the pool and load the model in each
+    of them, rather than on the first teaser. With NER on threads, the
+    model is loaded here.
+    """
+    executor = get_ner_executor()
+    if executor is None:
+        get_nlp_processor()
+        return
+    # Concurrent submissions make the pool start all of its processes
+    for future in [executor.submit(_load_model) for _ in range(NER_WORKERS)]:
+        future.result()
+
+def _load_model():
+    get_nlp_processor()
+
+def discard_ner_executor(executor: Executor):
+    """Shut down a broken NER pool so that the next request creates a new one"""
+    global _ner_executor
+    executor.shutdown(wait=False, cancel_futures=True)
+    if _ner_executor is executor:
+        _ner_executor = None
+
+def shutdown_ner_executor():
+    """Shut down the NER process pool, if it was started"""
+    global _ner_executor
+    if _ner_executor is not None:
+        _ner_executor.shutdown(wait=False, cancel_futures=True)
+    _ner_executor = None
+
+def _extract_entities_batch_sync(texts: List[str]) -> List[Dict[str, List[Dict]]]:
+    return get_nlp_processor().extract_entities_batch(texts)
+
+class NERService:
+    """
+    Batches entity extraction requests of concurrently processed teasers.
+    
+    Requests are collected for up to NER_BATCH_WAIT_SECONDS (or until
+    NER_MAX_BATCH_DOCS are pending) and sent to the NER process pool as one
+    nlp.pipe batch. Up to one batch per pool process is in flight at a time,
+    so extraction scales with the number of NER workers.
+    """
+    
+    def __init__(self, max_batch_docs: int = NER_MAX_BATCH_DOCS, batch_wait_seconds: float = NER_BATCH_WAIT_SECONDS):
+        self.max_batch_docs = max(max_batch_docs, 1)
+        self.batch_wait_seconds = batch_wait_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+    
+    async def extract_entities(self, text: str) -> Dict[str, List[Dict]]:
+        """Queue a text for extraction and wait for its entities"""
+        if self._dispatcher is None or self._dispatcher.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(max(NER_WORKERS, 1))
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
         
-        # Filter out empty categories
-        return {k: v for k, v in entities.items() if v}
\ No newline at end of file
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+    
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_wait_seconds
+            while len(batch) < self.max_batch_docs:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Skip requests whose pipeline was cancelled while they waited
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            await self._slots.acquire()
+            asyncio.ensure_future(self._run_batch(batch))
+    
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        executor = get_ner_executor()
+        try:
+            print(f"Extracting entities of {len(batch)} documents in one batch")
+            results = await asyncio.get_running_loop().run_in_executor(
+                executor, _extract_entities_batch_sync, [text for text, _ in batch]
+            )
+            for (_, future), entities in zip(batch, results):
+                if not future.done():
+                    future.set_result(entities)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # A process died or failed to load the model; start a fresh
+                # pool for the next batch instead of failing every teaser
+                print(f"NER process pool is broken, recreating it: {e}")
+                discard_ner_executor(executor)
+                # Retryable: the pipeline resumes from its last checkpoint
+                e = TransientPipelineError(f"NER process died: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+# Shared by all pipelines of this process
+ner_service = NERService()
+
+async def extract_entities_async(text: str) -> Dict[str, List[Dict]]:
+    """
+    Extract named entities off the event loop, in the NER process pool, so
+    that other pipeline stages (GPT calls) keep running meanwhile.
+    """
+    return await ner_service.extract_entities(text)
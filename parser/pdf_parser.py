@@ -4,46 +4,254 @@ from PIL import Image
 import io
 import os
 import tempfile
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from errors import TransientPipelineError
+from parser.pools import POOL_CONTEXT
+
+# Number of processes used for pdfplumber extraction; 0 runs it on a thread instead
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+
+# OCR budget: worker processes, pages rasterized per task, resolution and
+# threads per tesseract call (keep at 1 when running several workers)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_PAGES_PER_CHUNK = int(os.getenv("OCR_PAGES_PER_CHUNK", "2"))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_TESSERACT_THREADS = int(os.getenv("OCR_TESSERACT_THREADS", "1"))
+
+# Pages with fewer characters than this that are mostly covered by images
+# are treated as scans and sent to OCR
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "100"))
+OCR_MIN_IMAGE_COVERAGE = float(os.getenv("OCR_MIN_IMAGE_COVERAGE", "0.5"))
+
+@dataclass
+class PageExtraction:
+    """Text of a single page and how it was obtained ("text" or "ocr")"""
+    page_number: int
+    method: str
+    text: str = ""
+
+@dataclass
+class ExtractionResult:
+    """Per-page result of a PDF extraction"""
+    pages: List[PageExtraction] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(page.text for page in self.pages if page.text).strip()
+
+    @property
+    def page_methods(self) -> Dict[int, str]:
+        return {page.page_number: page.method for page in self.pages}
+
+_extraction_executor: Optional[Executor] = None
+_ocr_executor: Optional[Executor] = None
+
+def get_extraction_executor() -> Optional[Executor]:
+    """
+    Return the process pool used for PDF extraction, creating it on first use.
+    Returns None when extraction is configured to run on the default thread pool.
+    """
+    global _extraction_executor
+    if _extraction_executor is None and PDF_EXTRACTION_WORKERS > 0:
+        _extraction_executor = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS, mp_context=POOL_CONTEXT)
+    return _extraction_executor
+
+def get_ocr_executor() -> Executor:
+    """Return the process pool used for OCR, creating it on first use"""
+    global _ocr_executor
+    if _ocr_executor is None:
+        _ocr_executor = ProcessPoolExecutor(
+            max_workers=max(OCR_WORKERS, 1),
+            initializer=_init_ocr_worker,
+            initargs=(OCR_TESSERACT_THREADS,),
+            mp_context=POOL_CONTEXT,
+        )
+    return _ocr_executor
+
+def discard_extraction_executor(executor: Executor):
+    """Shut down a broken extraction pool so that the next request creates a new one"""
+    global _extraction_executor
+    executor.shutdown(wait=False, cancel_futures=True)
+    if _extraction_executor is executor:
+        _extraction_executor = None
+
+def discard_ocr_executor(executor: Executor):
+    """Shut down a broken OCR pool so that the next request creates a new one"""
+    global _ocr_executor
+    executor.shutdown(wait=False, cancel_futures=True)
+    if _ocr_executor is executor:
+        _ocr_executor = None
+
+def shutdown_executors():
+    """Shut down the extraction and OCR process pools, if they were started"""
+    global _extraction_executor, _ocr_executor
+    for executor in (_extraction_executor, _ocr_executor):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    _extraction_executor = None
+    _ocr_executor = None
 
 class PDFParser:
     @staticmethod
     async def extract_text_from_pdf(file_content: bytes) -> str:
         """
-        Extract text from a PDF file using pdfplumber.
-        If text extraction fails or returns empty, use OCR as a fallback.
+        Extract text from a PDF file using pdfplumber, falling back to OCR for
+        pages that only contain scanned images (see extract_pages).
+        """
+        result = await PDFParser.extract_pages(file_content)
+        return result.text
+
+    @staticmethod
+    async def extract_pages(
+        file_content: bytes, on_ocr_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+    ) -> ExtractionResult:
+        """
+        Extract text from a PDF file page by page.
+
+        Each page is classified from its character count and image coverage:
+        pages with a text layer go through pdfplumber, image-only pages are
+        routed to OCR. If pdfplumber cannot read the document at all, every
+        page is OCR'd.
+
+        The pdfplumber pass runs in a separate process so that it neither blocks
+        the event loop nor serialises concurrent uploads on a single core.
+
+        Args:
+            file_content: The PDF file content
+            on_ocr_progress: Optional coroutine called with (pages done, pages total)
+                             whenever a chunk of OCR pages finishes
+
+        Returns:
+            ExtractionResult: Per-page text and the method used for each page
+
+        Raises:
+            TransientPipelineError: If a worker process died during extraction
+        """
+        loop = asyncio.get_running_loop()
+        executor = get_extraction_executor()
+        try:
+            pages = await loop.run_in_executor(executor, PDFParser._extract_pages_sync, file_content)
+        except BrokenProcessPool as e:
+            # A pdfplumber process died; start a fresh pool for the retry and
+            # the next teasers instead of failing every one of them
+            print(f"PDF extraction pool is broken, recreating it: {e}")
+            discard_extraction_executor(executor)
+            raise TransientPipelineError(f"PDF extraction process died: {e}") from e
+        
+        # pdfplumber failed on the whole document, OCR everything
+        if pages is None:
+            page_texts = await PDFParser.ocr_pages(file_content, on_progress=on_ocr_progress)
+            return ExtractionResult(pages=[
+                PageExtraction(page_number=page_number, method="ocr", text=text.strip())
+                for page_number, text in sorted(page_texts.items())
+            ])
+        
+        # OCR only the pages classified as scanned
+        ocr_page_numbers = [page.page_number for page in pages if page.method == "ocr"]
+        if ocr_page_numbers:
+            page_texts = await PDFParser.ocr_pages(file_content, ocr_page_numbers, on_ocr_progress)
+            for page in pages:
+                if page.method == "ocr":
+                    page.text = page_texts.get(page.page_number, "").strip()
+        
+        return ExtractionResult(pages=pages)
+
+    @staticmethod
+    def _extract_pages_sync(file_content: bytes) -> Optional[List[PageExtraction]]:
+        """
+        Classify each page and extract text and tables from text pages with
+        pdfplumber (blocking). Returns None if the PDF could not be parsed.
         """
-        extracted_text = ""
+        pages = []
         
-        # First try with pdfplumber
         try:
             with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text() or ""
-                    extracted_text += page_text + "\n\n"
+                for page_number, page in enumerate(pdf.pages, start=1):
+                    if PDFParser._needs_ocr(page):
+                        # Leave the text to the OCR pass
+                        pages.append(PageExtraction(page_number=page_number, method="ocr"))
+                        continue
+                    
+                    page_text = (page.extract_text() or "") + "\n\n"
                     
                     # Extract tables if present
                     tables = page.extract_tables()
                     if tables:
                         for table in tables:
                             for row in table:
-                                extracted_text += " | ".join([str(cell or "") for cell in row]) + "\n"
-                            extracted_text += "\n"
+                                page_text += " | ".join([str(cell or "") for cell in row]) + "\n"
+                            page_text += "\n"
+                    
+                    pages.append(PageExtraction(page_number=page_number, method="text", text=page_text.strip()))
         
         except Exception as e:
             print(f"pdfplumber extraction failed: {e}")
+            return None
             
-        # If no text was extracted, try OCR
-        if not extracted_text.strip():
-            extracted_text = await PDFParser.extract_text_with_ocr(file_content)
-            
-        return extracted_text.strip()
+        return pages
+
+    @staticmethod
+    def _needs_ocr(page) -> bool:
+        """
+        Decide whether a pdfplumber page is a scanned image rather than text:
+        it has no text layer at all, or very little text on a page mostly
+        covered by images.
+        """
+        char_count = len(page.chars)
+        if char_count == 0:
+            return True
+        if char_count >= OCR_MIN_PAGE_CHARS:
+            return False
+        
+        page_area = float(page.width * page.height) or 1.0
+        image_area = 0.0
+        for image in page.images:
+            # Clip each image to the page before measuring it
+            width = min(image["x1"], page.width) - max(image["x0"], 0)
+            height = min(image["bottom"], page.height) - max(image["top"], 0)
+            if width > 0 and height > 0:
+                image_area += width * height
+        return image_area / page_area >= OCR_MIN_IMAGE_COVERAGE
     
     @staticmethod
-    async def extract_text_with_ocr(file_content: bytes) -> str:
+    async def extract_text_with_ocr(file_content: bytes, pages: Optional[List[int]] = None) -> str:
         """
         Extract text from a PDF file using OCR (pytesseract).
+
+        Pages are rasterized and recognised in chunks of OCR_PAGES_PER_CHUNK
+        pages spread over a pool of OCR_WORKERS processes, then reassembled in
+        page order.
+
+        Args:
+            file_content: The PDF file content
+            pages: Optional list of 1-based page numbers to OCR; all pages if None
+        """
+        page_texts = await PDFParser.ocr_pages(file_content, pages)
+        return "\n\n".join(page_texts[page] for page in sorted(page_texts)).strip()
+
+    @staticmethod
+    async def ocr_pages(
+        file_content: bytes,
+        pages: Optional[List[int]] = None,
+        on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    ) -> Dict[int, str]:
         """
-        extracted_text = ""
+        OCR the given pages of a PDF in parallel, optionally reporting
+        (pages done, pages total) through on_progress as chunks finish.
+
+        Returns:
+            Dict[int, str]: Recognised text keyed by 1-based page number
+
+        Raises:
+            TransientPipelineError: If an OCR worker process died
+        """
+        page_texts = {}
+        executor = None
         
         # Create a temporary file to save the PDF
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_pdf:
@@ -51,18 +259,42 @@ class PDFParser:
             temp_pdf_path = temp_pdf.name
         
         try:
-            # Use a temporary directory for images
-            with tempfile.TemporaryDirectory() as temp_dir:
-                from pdf2image import convert_from_path
-                
-                # Convert PDF to images
-                images = convert_from_path(temp_pdf_path, output_folder=temp_dir)
-                
-                # Extract text from each image
-                for i, image in enumerate(images):
-                    text = pytesseract.image_to_string(image)
-                    extracted_text += text + "\n\n"
+            if pages is None:
+                from pdf2image import pdfinfo_from_path
+                pages = list(range(1, pdfinfo_from_path(temp_pdf_path)["Pages"] + 1))
+            
+            # Rasterize and recognise each chunk of pages in a worker process
+            loop = asyncio.get_running_loop()
+            executor = get_ocr_executor()
+            chunks = _chunk_pages(pages, OCR_PAGES_PER_CHUNK)
+            pages_done = 0
+            
+            async def ocr_chunk(first_page: int, last_page: int) -> List[str]:
+                nonlocal pages_done
+                texts = await loop.run_in_executor(
+                    executor, _ocr_page_range, temp_pdf_path, first_page, last_page, OCR_DPI
+                )
+                pages_done += last_page - first_page + 1
+                if on_progress:
+                    await on_progress(pages_done, len(pages))
+                return texts
+            
+            chunk_results = await asyncio.gather(*[
+                ocr_chunk(first_page, last_page) for first_page, last_page in chunks
+            ])
+            
+            # Reassemble in page order
+            for (first_page, last_page), texts in zip(chunks, chunk_results):
+                for page_number, text in zip(range(first_page, last_page + 1), texts):
+                    page_texts[page_number] = text
         
+        except BrokenProcessPool as e:
+            # An OCR process died (e.g. pdftoppm or tesseract was OOM-killed).
+            # Returning the pages empty would checkpoint the teaser without
+            # their text, so start a fresh pool and let the stage be retried
+            print(f"OCR pool is broken, recreating it: {e}")
+            discard_ocr_executor(executor)
+            raise TransientPipelineError(f"OCR process died: {e}") from e
         except Exception as e:
             print(f"OCR extraction failed: {e}")
             
@@ -71,4 +303,43 @@ class PDFParser:
             if os.path.exists(temp_pdf_path):
                 os.remove(temp_pdf_path)
                 
-        return extracted_text.strip()
\ No newline at end of file
+        return page_texts
+
+def _chunk_pages(pages: List[int], chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Group page numbers into (first_page, last_page) ranges of consecutive pages,
+    each at most chunk_size pages long
+    """
+    chunks = []
+    for page_number in sorted(set(pages)):
+        if chunks and chunks[-1][1] == page_number - 1 and page_number - chunks[-1][0] < chunk_size:
+            chunks[-1] = (chunks[-1][0], page_number)
+        else:
+            chunks.append((page_number, page_number))
+    return chunks
+
+def _init_ocr_worker(tesseract_threads: int):
+    """Limit the threads each tesseract call may use inside an OCR worker"""
+    os.environ["OMP_THREAD_LIMIT"] = str(tesseract_threads)
+
+def _ocr_page_range(pdf_path: str, first_page: int, last_page: int, dpi: int) -> List[str]:
+    """
+    Rasterize and OCR a range of pages (runs inside an OCR worker process)
+    """
+    from pdf2image import convert_from_path
+    
+    texts = []
+    # Use a temporary directory for images
+    with tempfile.TemporaryDirectory() as temp_dir:
+        images = convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            output_folder=temp_dir,
+        )
+        
+        # Extract text from each image
+        for image in images:
+            texts.append(pytesseract.image_to_string(image))
+    return texts
@@ -0,0 +1,6 @@
+import multiprocessing
+
+# The extraction, OCR and NER pools are created from multi-threaded worker
+# processes, where forking can leave a child stuck on a lock held by another
+# thread at fork time; start their processes from a clean fork server instead
+POOL_CONTEXT = multiprocessing.get_context("forkserver")
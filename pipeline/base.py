@@ -1,50 +1,219 @@
 import os
-from typing import Dict, List, Optional, Any
-from models import Teaser, TeaserStatus
-from sqlalchemy.orm import Session
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from models import Teaser, TeaserStatus, TeaserCheckpoint
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from abc import ABC, abstractmethod
+from progress import publish_progress
+from errors import TransientPipelineError
+
+@dataclass
+class PipelineStage:
+    """
+    A named unit of pipeline work. Its completion is checkpointed, so a
+    stage that finished is skipped when the pipeline is run again.
+    
+    run is called with the teaser ID and a context dict shared by all stages
+    of a run, and returns False if the teaser can't be processed further.
+    A stage starts once all stages named in depends_on have completed;
+    stages that don't depend on each other run concurrently.
+    """
+    name: str
+    run: Callable[[int, Dict[str, Any]], Awaitable[bool]]
+    depends_on: List[str] = field(default_factory=list)
 
 class Pipeline(ABC):
     """Base abstract class for processing pipelines"""
     
-    def __init__(self, db: Session):
-        self.db = db
+    def __init__(self, session_factory: async_sessionmaker):
+        # Steps open their own short-lived sessions from this factory rather
+        # than holding one connection for the whole (minutes long) run
+        self.session_factory = session_factory
     
     @abstractmethod
-    async def _run_pipeline_steps(self, teaser_id: int, selected_blocks: Optional[List[str]] = None) -> bool:
-        """Execute the pipeline steps on a teaser"""
+    def _define_stages(self) -> List[PipelineStage]:
+        """Return the stages of the pipeline and their dependencies"""
         pass
     
-    async def _generate_report(self, teaser_id: int) -> Optional[str]:
-        """Generate a report based on the processed data"""
-        pass
+    @staticmethod
+    def _validate_stages(stages: List[PipelineStage]):
+        """Reject unknown dependencies and dependency cycles"""
+        by_name = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in by_name:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+        
+        resolved: Set[str] = set()
+        while len(resolved) < len(stages):
+            ready = {
+                stage.name for stage in stages
+                if stage.name not in resolved and all(d in resolved for d in stage.depends_on)
+            }
+            if not ready:
+                raise ValueError(f"Dependency cycle between stages {sorted(set(by_name) - resolved)}")
+            resolved |= ready
+    
+    @staticmethod
+    def _dependent_stages(stages: List[PipelineStage], name: str) -> Set[str]:
+        """Return the given stage and every stage that (transitively) depends on it"""
+        dependents = {name}
+        changed = True
+        while changed:
+            changed = False
+            for stage in stages:
+                if stage.name not in dependents and dependents.intersection(stage.depends_on):
+                    dependents.add(stage.name)
+                    changed = True
+        return dependents
+    
+    async def _report_progress(self, teaser_id: int, stage: str, **data):
+        """Publish a stage transition for clients following the teaser's progress"""
+        await publish_progress(teaser_id, stage, **data)
+    
+    async def _completed_stages(self, teaser_id: int) -> Set[str]:
+        async with self.session_factory() as db:
+            result = await db.execute(select(TeaserCheckpoint.stage).where(TeaserCheckpoint.teaser_id == teaser_id))
+            return set(result.scalars().all())
+    
+    async def _save_checkpoint(self, teaser_id: int, stage: str):
+        async with self.session_factory() as db:
+            await db.execute(
+                insert(TeaserCheckpoint)
+                .values(teaser_id=teaser_id, stage=stage)
+                .on_conflict_do_nothing(constraint="uq_teaser_checkpoints_stage")
+            )
+            await db.commit()
+    
+    async def _clear_checkpoints(self, teaser_id: int, stages: Set[str]):
+        async with self.session_factory() as db:
+            await db.execute(
+                delete(TeaserCheckpoint)
+                .where(TeaserCheckpoint.teaser_id == teaser_id, TeaserCheckpoint.stage.in_(stages))
+            )
+            await db.commit()
+    
+    async def is_current_run(self, teaser_id: int, run_id: Optional[str]) -> bool:
+        """
+        Whether run_id is still the teaser's run, i.e. the teaser wasn't
+        cancelled or queued again since. Jobs without a run token are always
+        current.
+        """
+        if run_id is None:
+            return True
+        async with self.session_factory() as db:
+            result = await db.execute(select(Teaser.run_id).where(Teaser.id == teaser_id))
+            return result.scalar_one_or_none() == run_id
+    
+    async def mark_failed(self, teaser_id: int, detail: str, run_id: Optional[str] = None):
+        """Mark a teaser as failed, unless it was cancelled or queued again in the meantime"""
+        async with self.session_factory() as db:
+            # Hold the row until the status is written so no new run is queued in between
+            teaser = await db.get(Teaser, teaser_id, with_for_update=True)
+            if teaser is None or teaser.status == TeaserStatus.CANCELLED:
+                return
+            if run_id is not None and teaser.run_id != run_id:
+                print(f"Teaser {teaser_id} was queued again, not marking it as failed")
+                return
+            teaser.status = TeaserStatus.ERROR
+            await db.commit()
+        await self._report_progress(teaser_id, "error", detail=detail)
     
-    async def process(self, teaser_id: int, selected_blocks: Optional[List[str]] = None) -> bool:
+    async def process(
+        self,
+        teaser_id: int,
+        selected_blocks: Optional[List[str]] = None,
+        restart_from: Optional[str] = None,
+        run_id: Optional[str] = None
+    ) -> bool:
         """
-        Process a teaser through the pipeline
+        Process a teaser through the pipeline, resuming after the last
+        checkpointed stages. Stages whose dependencies are met run
+        concurrently. The run stops before its next stage once it is no
+        longer the teaser's current run.
         
         Args:
             teaser_id: The ID of the teaser to process
             selected_blocks: Optional list of building block IDs to include in the processing
+            restart_from: Optional stage name; its checkpoint and those of all stages
+                          depending on it are discarded so they run again
+            run_id: Optional token of the run (see Teaser.run_id)
             
         Returns:
             bool: True if processing was successful, False otherwise
+            
+        Raises:
+            TransientPipelineError: If a stage failed in a way that is worth retrying
+            OperationalError: If the database was unreachable
         """
+        stages = self._define_stages()
+        self._validate_stages(stages)
         try:
-            # Run the pipeline steps
-            success = await self._run_pipeline_steps(teaser_id, selected_blocks)
+            if not await self.is_current_run(teaser_id, run_id):
+                print(f"Run {run_id} of teaser {teaser_id} is stale, skipping")
+                return False
+            if restart_from:
+                await self._clear_checkpoints(teaser_id, self._dependent_stages(stages, restart_from))
             
-            if success:
-                # Generate the report
-                report_path = await self._generate_report(teaser_id)
-                
-                # If report generation failed, mark as error
-                if not report_path:
-                    return False
-                
-                return True
-            
-            return False
+            completed = await self._completed_stages(teaser_id)
+            for name in completed:
+                print(f"Skipping stage '{name}' for teaser {teaser_id}, already checkpointed")
+            context = {"selected_blocks": selected_blocks, "run_id": run_id}
+            return await self._run_stages(teaser_id, stages, completed, context)
+        except (TransientPipelineError, OperationalError):
+            # Leave the teaser in processing, a retry resumes from the last checkpoint
+            raise
         except Exception as e:
             print(f"Error in pipeline processing: {str(e)}")
-            return False
\ No newline at end of file
+            import traceback
+            traceback.print_exc()
+            await self.mark_failed(teaser_id, str(e), run_id)
+            return False
+    
+    async def _run_stages(
+        self,
+        teaser_id: int,
+        stages: List[PipelineStage],
+        completed: Set[str],
+        context: Dict[str, Any]
+    ) -> bool:
+        """
+        Run the stages that aren't completed yet, each as soon as its
+        dependencies are done. If a stage fails, or the run was replaced
+        by another one, the stages still running are cancelled.
+        """
+        completed = set(completed)
+        running: Dict[asyncio.Task, PipelineStage] = {}
+        try:
+            while True:
+                started = set(completed) | {stage.name for stage in running.values()}
+                ready = [
+                    stage for stage in stages
+                    if stage.name not in started and all(d in completed for d in stage.depends_on)
+                ]
+                if ready and not await self.is_current_run(teaser_id, context.get("run_id")):
+                    print(f"Run {context.get('run_id')} of teaser {teaser_id} is stale, stopping")
+                    return False
+                for stage in ready:
+                    print(f"Starting stage '{stage.name}' for teaser {teaser_id}")
+                    running[asyncio.ensure_future(stage.run(teaser_id, context))] = stage
+                if not running:
+                    return True
+                
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = running.pop(task)
+                    if not task.result():
+                        print(f"Stage '{stage.name}' failed for teaser {teaser_id}")
+                        return False
+                    await self._save_checkpoint(teaser_id, stage.name)
+                    completed.add(stage.name)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
@@ -0,0 +1,121 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+# Connection pool and timeout settings for calls to the OpenAI API
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "20"))
+OPENAI_POOL_SIZE_PER_HOST = int(os.getenv("OPENAI_POOL_SIZE_PER_HOST", "10"))
+OPENAI_KEEPALIVE_TIMEOUT = float(os.getenv("OPENAI_KEEPALIVE_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "180"))
+# How often a worker logs the pool metrics, 0 disables the log line
+OPENAI_STATS_INTERVAL_SECONDS = float(os.getenv("OPENAI_STATS_INTERVAL_SECONDS", "60"))
+
+class OpenAIHTTPClient:
+    """
+    Long-lived, pooled HTTP client for the OpenAI API.
+
+    One instance is meant to live as long as the process that owns it (a
+    worker) so that DNS lookups, TCP connections and TLS sessions are reused
+    across requests. The underlying aiohttp session is created lazily on the
+    event loop that first uses it.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = OPENAI_POOL_SIZE,
+        pool_size_per_host: int = OPENAI_POOL_SIZE_PER_HOST,
+        keepalive_timeout: float = OPENAI_KEEPALIVE_TIMEOUT,
+        connect_timeout: float = OPENAI_CONNECT_TIMEOUT,
+        request_timeout: float = OPENAI_REQUEST_TIMEOUT,
+    ):
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=request_timeout, connect=connect_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # Utilisation metrics
+        self.requests_total = 0
+        self.errors_total = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    @asynccontextmanager
+    async def post(self, url: str, **kwargs):
+        """
+        Send a POST request through the shared connection pool
+        """
+        session = self._get_session()
+        self.requests_total += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            async with session.post(url, **kwargs) as response:
+                yield response
+        except Exception:
+            self.errors_total += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return connection pool utilisation metrics
+        """
+        acquired = 0
+        idle = 0
+        if self._session is not None and not self._session.closed:
+            connector = self._session.connector
+            acquired = len(getattr(connector, "_acquired", ()))
+            idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+        return {
+            "pool_size": self.pool_size,
+            "pool_size_per_host": self.pool_size_per_host,
+            "connections_acquired": acquired,
+            "connections_idle": idle,
+            "requests_in_flight": self.in_flight,
+            "max_requests_in_flight": self.max_in_flight,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+        }
+
+    async def log_stats_periodically(self, interval: float = OPENAI_STATS_INTERVAL_SECONDS):
+        """
+        Print the pool metrics every interval seconds, skipping intervals
+        without any requests. Runs until cancelled.
+        """
+        if interval <= 0:
+            return
+        logged_requests = self.requests_total
+        while True:
+            await asyncio.sleep(interval)
+            if self.requests_total == logged_requests and self.in_flight == 0:
+                continue
+            logged_requests = self.requests_total
+            print(f"OpenAI connection pool: {self.stats()}")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "OpenAIHTTPClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -1,23 +1,55 @@
 import os
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Awaitable, Callable, Tuple
 import datetime
 import json
 import aiohttp
 import asyncio
+import hashlib
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.sql import func
 
-from pipeline.base import Pipeline
-from models import Teaser, TeaserStatus
+from pipeline.base import Pipeline, PipelineStage, TransientPipelineError
+from pipeline.http_client import OpenAIHTTPClient, OPENAI_CONNECT_TIMEOUT
+from models import Teaser, TeaserStatus, LLMBlockCache
 from parser.pdf_parser import PDFParser
-from parser.nlp import NLPProcessor
+from parser.nlp import NLPProcessor, extract_entities_async
 from document_generator.screening_report import generate_screening_report
+from storage import read_upload
+
+# Model used for the analysis
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4-turbo")
+
+# Bump whenever the prompts or block descriptions change so that cached
+# analysis produced with the old prompts is no longer reused
+PROMPT_VERSION = "1"
+
+# "batched" sends all blocks in a single request, "fanout" splits them into
+# groups of OPENAI_BLOCKS_PER_REQUEST that are requested concurrently
+OPENAI_EXECUTION_MODE = os.getenv("OPENAI_EXECUTION_MODE", "batched")
+OPENAI_BLOCKS_PER_REQUEST = int(os.getenv("OPENAI_BLOCKS_PER_REQUEST", "4"))
+OPENAI_MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENT_REQUESTS", "4"))
+
+# Stream completions and persist each section as soon as it is complete
+OPENAI_STREAM = os.getenv("OPENAI_STREAM", "false").lower() == "true"
+# Maximum silence between two streamed chunks before giving up
+OPENAI_STREAM_READ_TIMEOUT = float(os.getenv("OPENAI_STREAM_READ_TIMEOUT", "60"))
+
+# Marker GPT is asked to put in front of every section of its response
+SECTION_MARKER = "---SECTION: "
 
 class SimpleOpenAIPipeline(Pipeline):
     """
     Concrete implementation of the Pipeline for processing teaser documents
     """
-    def __init__(self, db, nlp_processor=None):
-        super().__init__(db)
-        self.nlp_processor = nlp_processor or NLPProcessor()
+    def __init__(self, session_factory, nlp_processor=None, http_client: Optional[OpenAIHTTPClient] = None):
+        super().__init__(session_factory)
+        # Optional in-process NER; by default entities are extracted in the NER process pool
+        self.nlp_processor: Optional[NLPProcessor] = nlp_processor
+        # Shared, pooled client for the OpenAI API; a throwaway one is used per call if not provided
+        self.http_client = http_client
         # Create reports directory if it doesn't exist
         os.makedirs("reports", exist_ok=True)
         # Get API key from environment variable
@@ -113,108 +145,327 @@ class SimpleOpenAIPipeline(Pipeline):
         else:
             print("WARNING: OpenAI API key is not configured. GPT analysis will be skipped.")
             
-    async def _run_pipeline_steps(self, teaser_id: int, selected_blocks: Optional[List[str]] = None) -> bool:
+    def _define_stages(self) -> List[PipelineStage]:
         """
-        Run selected pipeline steps for teaser document processing
-        
-        Args:
-            teaser_id: The ID of the teaser to process
-            selected_blocks: Optional list of building block IDs to include in the processing
-                             If None, all blocks will be processed
+        Stages of teaser processing. Every stage reads and writes through its
+        own short-lived session, so no database connection is held while OCR,
+        spaCy, GPT or ReportLab are running.
         """
-        try:
-            # Fetch the teaser from the database
-            teaser = self.db.query(Teaser).filter(Teaser.id == teaser_id).first()
+        return [
+            PipelineStage("extract", self._extract_text),
+            # NER and GPT analysis only need the text, so they run side by side
+            PipelineStage("entities", self._extract_entities, depends_on=["extract"]),
+            PipelineStage("analysis", self._analyze, depends_on=["extract"]),
+            PipelineStage("report", self._build_report, depends_on=["entities", "analysis"]),
+        ]
+
+    async def _extract_text(self, teaser_id: int, context: Dict[str, Any]) -> bool:
+        """
+        Extract the text of the uploaded PDF, OCR-ing only the scanned pages.
+        Duplicate uploads already carry the text of their original.
+        """
+        async with self.session_factory() as db:
+            teaser = await self._load_teaser(db, teaser_id, Teaser.document)
             if not teaser:
                 print(f"Teaser with ID {teaser_id} not found")
                 return False
-                
-            # If the teaser doesn't have entities yet, extract them
-            if not teaser.entities and teaser.extracted_text:
-                teaser.entities = self.nlp_processor.extract_entities(teaser.extracted_text)
-                self.db.commit()
-                
-            # Process only if we have text and an API key
-            if teaser.extracted_text and self.openai_api_key:
-                print(f"Starting selective GPT analysis for teaser {teaser.id}")
-                
-                # If no specific blocks are selected, use all available blocks
-                blocks_to_process = selected_blocks if selected_blocks else list(self.building_blocks.keys())
-                print(f"Processing blocks: {blocks_to_process}")
-                
-                # Only process blocks that exist in building_blocks
-                valid_blocks = [block_id for block_id in blocks_to_process if block_id in self.building_blocks]
-                if valid_blocks:
-                    # Process all blocks in batched mode to save tokens
-                    batch_results = await self._analyze_multiple_blocks_with_gpt(
-                        text=teaser.extracted_text,
-                        blocks_to_process=[
-                            (block_id, 
-                             self.building_blocks[block_id]['name'], 
-                             self.building_blocks[block_id]['description'])
-                            for block_id in valid_blocks
-                        ]
-                    )
-                    
-                    # Initialize the GPT analysis dictionary - keep it flat for simplicity
-                    teaser.gpt_analysis = {}
-                    
-                    # Store all section results directly in the top level of gpt_analysis
-                    processed_sections_count = 0
-                    for block_id, block_name in [(b, self.building_blocks[b]['name']) for b in valid_blocks]:
-                        # Check if we have content for this block_id
-                        if block_id in batch_results and batch_results[block_id]:
-                            content = batch_results[block_id]
-                            processed_sections_count += 1
-                            print(f"✅ Storing analysis for {block_name} ({len(content)} chars)")
-                            
-                            # Store content directly with the section name as key
-                            teaser.gpt_analysis[block_name] = content
-                        else:
-                            print(f"⚠️ No content found for {block_name}")
-                            # Store empty content
-                            teaser.gpt_analysis[block_name] = ""
-                    
-                    print(f"Successfully processed and stored {processed_sections_count} out of {len(valid_blocks)} blocks")
-                    
-                    # Save the updated gpt_analysis to the database
-                    self.db.commit()
-                    print(f"GPT analysis completed and stored for teaser {teaser.id}")
-                else:
-                    print("No valid blocks selected for processing")
+            if teaser.document is not None:
+                return True
+        
+        file_content = await read_upload(teaser_id)
+        
+        async def report_ocr_progress(pages_done: int, pages_total: int):
+            await self._report_progress(teaser_id, "ocr", page=pages_done, total=pages_total)
+        
+        await self._report_progress(teaser_id, "extracting")
+        extraction = await PDFParser.extract_pages(file_content, report_ocr_progress)
+        ocr_pages = [number for number, method in extraction.page_methods.items() if method == "ocr"]
+        print(f"Extracted {len(extraction.pages)} pages for teaser {teaser_id}, OCR used on pages {ocr_pages}")
+        
+        async with self.session_factory() as db:
+            teaser = await self._load_teaser(db, teaser_id, Teaser.document)
+            teaser.extracted_text = extraction.text
+            await db.commit()
+        await self._report_progress(teaser_id, "extracted", pages=len(extraction.pages), ocr_pages=ocr_pages)
+        return True
+
+    async def _extract_entities(self, teaser_id: int, context: Dict[str, Any]) -> bool:
+        """Run NER on the extracted text, unless the teaser already has entities"""
+        async with self.session_factory() as db:
+            teaser = await self._load_teaser(db, teaser_id, Teaser.document, Teaser.entity_rows)
+            extracted_text = teaser.extracted_text
+            has_entities = bool(teaser.entity_rows)
+        
+        if not has_entities and extracted_text:
+            await self._report_progress(teaser_id, "ner")
+            if self.nlp_processor:
+                entities = await asyncio.get_running_loop().run_in_executor(
+                    None, self.nlp_processor.extract_entities, extracted_text
+                )
             else:
-                if not teaser.extracted_text:
-                    print(f"Skipping GPT analysis for teaser {teaser.id} - No extracted text available")
-                if not self.openai_api_key:
-                    print(f"Skipping GPT analysis for teaser {teaser.id} - No API key available")
+                entities = await extract_entities_async(extracted_text)
+            async with self.session_factory() as db:
+                teaser = await self._load_teaser(db, teaser_id, Teaser.entity_rows)
+                teaser.entities = entities
+                await db.commit()
+        return True
+
+    async def _analyze(self, teaser_id: int, context: Dict[str, Any]) -> bool:
+        """
+        Analyze the selected building blocks with GPT.
+        
+        Every section is cached as soon as it is received, so when the stage
+        is retried (e.g. after a rate limit) only the missing blocks are
+        requested again.
+        """
+        async with self.session_factory() as db:
+            teaser = await self._load_teaser(db, teaser_id, Teaser.document)
+            extracted_text = teaser.extracted_text
+        
+        # Process only if we have text and an API key
+        if not extracted_text or not self.openai_api_key:
+            if not extracted_text:
+                print(f"Skipping GPT analysis for teaser {teaser_id} - No extracted text available")
+            if not self.openai_api_key:
+                print(f"Skipping GPT analysis for teaser {teaser_id} - No API key available")
+            return True
+        
+        print(f"Starting selective GPT analysis for teaser {teaser_id}")
+        
+        # If no specific blocks are selected, use all available blocks
+        selected_blocks = context.get("selected_blocks")
+        blocks_to_process = selected_blocks if selected_blocks else list(self.building_blocks.keys())
+        print(f"Processing blocks: {blocks_to_process}")
+        
+        # Only process blocks that exist in building_blocks
+        valid_blocks = [block_id for block_id in blocks_to_process if block_id in self.building_blocks]
+        if not valid_blocks:
+            print("No valid blocks selected for processing")
+            return True
+        
+        # Reuse sections already produced for the same text
+        text_hash = hashlib.sha256(extracted_text.encode("utf-8")).hexdigest()
+        batch_results = await self._find_cached_block_results(text_hash, valid_blocks)
+        missing_blocks = [block_id for block_id in valid_blocks if block_id not in batch_results]
+        if batch_results:
+            print(f"Reusing cached analysis for {len(batch_results)} blocks")
+        await self._report_progress(
+            teaser_id, "analyzing", blocks=valid_blocks, cached_blocks=list(batch_results)
+        )
+        announced_blocks = set()
+        
+        if missing_blocks:
+            # Make cached sections visible right away, new ones are added as they arrive
+            async with self.session_factory() as db:
+                teaser = await self._load_teaser(db, teaser_id, Teaser.sections)
+                teaser.gpt_analysis = {
+                    self.building_blocks[block_id]['name']: content
+                    for block_id, content in batch_results.items()
+                }
+                await db.commit()
             
-            # Generate the report using the generate_screening_report function
-            report_path = await generate_screening_report(teaser)
+            async def store_section(block_id: str, content: str):
+                async with self.session_factory() as db:
+                    teaser = await self._load_teaser(db, teaser_id, Teaser.sections)
+                    teaser.set_section(self.building_blocks[block_id]['name'], content)
+                    await db.commit()
+                await self._store_cached_block_results(text_hash, {block_id: content})
+                announced_blocks.add(block_id)
+                await self._report_progress(teaser_id, "block_done", block=block_id)
+            
+            # Process all remaining blocks, batched or fanned out depending on the mode
+            new_results = await self._analyze_blocks_with_gpt(
+                text=extracted_text,
+                blocks_to_process=[
+                    (block_id, 
+                     self.building_blocks[block_id]['name'], 
+                     self.building_blocks[block_id]['description'])
+                    for block_id in missing_blocks
+                ],
+                on_section=store_section,
+            )
+            await self._store_cached_block_results(text_hash, new_results)
+            batch_results.update(new_results)
+        
+        # Build the GPT analysis dictionary - keep it flat for simplicity
+        gpt_analysis = {}
+        
+        # Store all section results directly in the top level of gpt_analysis
+        processed_sections_count = 0
+        for block_id, block_name in [(b, self.building_blocks[b]['name']) for b in valid_blocks]:
+            # Check if we have content for this block_id
+            if block_id in batch_results and batch_results[block_id]:
+                content = batch_results[block_id]
+                processed_sections_count += 1
+                print(f"✅ Storing analysis for {block_name} ({len(content)} chars)")
+                
+                # Store content directly with the section name as key
+                gpt_analysis[block_name] = content
+                if block_id not in announced_blocks:
+                    await self._report_progress(teaser_id, "block_done", block=block_id)
+            else:
+                print(f"⚠️ No content found for {block_name}")
+                # Store empty content
+                gpt_analysis[block_name] = ""
+        
+        print(f"Successfully processed and stored {processed_sections_count} out of {len(valid_blocks)} blocks")
+        
+        # Save the updated gpt_analysis to the database
+        async with self.session_factory() as db:
+            teaser = await self._load_teaser(db, teaser_id, Teaser.sections)
+            teaser.gpt_analysis = gpt_analysis
+            await db.commit()
+        print(f"GPT analysis completed and stored for teaser {teaser_id}")
+        return True
+
+    async def _build_report(self, teaser_id: int, context: Dict[str, Any]) -> bool:
+        """
+        Generate the screening report and complete the teaser. The report is
+        built from a detached teaser so the session is closed while ReportLab runs.
+        """
+        await self._report_progress(teaser_id, "building_report")
+        async with self.session_factory() as db:
+            teaser = await self._load_teaser(db, teaser_id, Teaser.sections)
+        report_path = await generate_screening_report(teaser)
+        
+        async with self.session_factory() as db:
+            # Lock the row so the API can't queue a new run between check and update
+            teaser = await db.get(Teaser, teaser_id, with_for_update=True)
+            if teaser.status == TeaserStatus.CANCELLED or (
+                context["run_id"] is not None and teaser.run_id != context["run_id"]
+            ):
+                print(f"Teaser {teaser_id} was cancelled or queued again, discarding the report")
+                return False
             if report_path:
                 teaser.report_path = report_path
                 teaser.status = TeaserStatus.COMPLETED
-                self.db.commit()
-                return True
             else:
                 teaser.status = TeaserStatus.ERROR
-                self.db.commit()
-                return False
-                
-        except Exception as e:
-            print(f"Error in pipeline steps: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            # Mark as error in case of exception
-            try:
-                teaser = self.db.query(Teaser).filter(Teaser.id == teaser_id).first()
-                if teaser:
-                    teaser.status = TeaserStatus.ERROR
-                    self.db.commit()
-            except:
-                pass
+            await db.commit()
+        
+        if report_path:
+            await self._report_progress(teaser_id, "report_built")
+            await self._report_progress(teaser_id, "completed")
+            return True
+        else:
+            await self._report_progress(teaser_id, "error", detail="Report generation failed")
             return False
 
-    async def _analyze_multiple_blocks_with_gpt(self, text: str, blocks_to_process: List[tuple]) -> Dict[str, str]:
+    @staticmethod
+    async def _load_teaser(db: AsyncSession, teaser_id: int, *payloads) -> Optional[Teaser]:
+        """
+        Load a teaser together with the given payload relationships, which
+        can't be lazily loaded on an async session
+        """
+        result = await db.execute(
+            select(Teaser)
+            .options(*[selectinload(payload) for payload in payloads])
+            .where(Teaser.id == teaser_id)
+        )
+        return result.scalars().first()
+
+    async def _find_cached_block_results(self, text_hash: str, block_ids: List[str]) -> Dict[str, str]:
+        """
+        Look up cached analysis of the requested blocks for the given text,
+        produced with the current prompt version and model.
+        
+        Returns:
+            Dict[str, str]: Dictionary mapping block_ids to cached analysis results
+        """
+        async with self.session_factory() as db:
+            cached = (await db.execute(
+                select(LLMBlockCache).where(
+                    LLMBlockCache.text_hash == text_hash,
+                    LLMBlockCache.block_id.in_(block_ids),
+                    LLMBlockCache.prompt_version == PROMPT_VERSION,
+                    LLMBlockCache.model == OPENAI_MODEL,
+                )
+            )).scalars().all()
+        return {entry.block_id: entry.content for entry in cached if entry.content}
+
+    async def _store_cached_block_results(self, text_hash: str, results: Dict[str, str]):
+        """
+        Persist freshly generated block analysis in the cache
+        """
+        rows = [
+            {
+                "text_hash": text_hash,
+                "block_id": block_id,
+                "prompt_version": PROMPT_VERSION,
+                "model": OPENAI_MODEL,
+                "content": content,
+            }
+            for block_id, content in results.items() if content
+        ]
+        if not rows:
+            return
+        
+        # Another worker may have cached the same block concurrently
+        statement = insert(LLMBlockCache).values(rows)
+        statement = statement.on_conflict_do_update(
+            constraint="uq_llm_block_cache_key",
+            set_={"content": statement.excluded.content, "created_at": func.now()},
+        )
+        async with self.session_factory() as db:
+            await db.execute(statement)
+            await db.commit()
+
+    async def _analyze_blocks_with_gpt(
+        self,
+        text: str,
+        blocks_to_process: List[tuple],
+        on_section: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ) -> Dict[str, str]:
+        """
+        Analyze the given blocks in the configured execution mode.
+        
+        In fan-out mode the blocks are split into groups that are sent as
+        concurrent requests, at most OPENAI_MAX_CONCURRENT_REQUESTS at a time,
+        so latency is bounded by the slowest group rather than by one long
+        request, and each section gets a larger share of the token budget.
+        
+        Args:
+            text: The teaser text to analyze
+            blocks_to_process: List of tuples containing (block_id, block_name, block_description)
+            on_section: Optional coroutine called with (block_id, content) for every
+                        section as soon as it is received
+            
+        Returns:
+            Dict[str, str]: Dictionary mapping block_ids to their analysis results
+        """
+        if OPENAI_EXECUTION_MODE != "fanout" or len(blocks_to_process) <= OPENAI_BLOCKS_PER_REQUEST:
+            return await self._analyze_multiple_blocks_with_gpt(text, blocks_to_process, on_section)
+        
+        groups = [
+            blocks_to_process[i:i + OPENAI_BLOCKS_PER_REQUEST]
+            for i in range(0, len(blocks_to_process), OPENAI_BLOCKS_PER_REQUEST)
+        ]
+        print(f"Fanning out {len(blocks_to_process)} blocks into {len(groups)} concurrent requests")
+        semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENT_REQUESTS)
+        
+        async def analyze_group(group: List[tuple]) -> Dict[str, str]:
+            async with semaphore:
+                return await self._analyze_multiple_blocks_with_gpt(text, group, on_section)
+        
+        results = {}
+        failures = []
+        for group_results in await asyncio.gather(*[analyze_group(group) for group in groups], return_exceptions=True):
+            if isinstance(group_results, BaseException):
+                failures.append(group_results)
+            else:
+                results.update(group_results)
+        # Sections of the groups that succeeded have been handed to on_section
+        # already, so a retry only requests the failed groups again
+        if failures:
+            raise failures[0]
+        return results
+
+    async def _analyze_multiple_blocks_with_gpt(
+        self,
+        text: str,
+        blocks_to_process: List[tuple],
+        on_section: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ) -> Dict[str, str]:
         """
         Analyze multiple sections of the teaser using GPT with a shared context
         to optimize token usage by sending the teaser content only once.
@@ -222,9 +473,14 @@ class SimpleOpenAIPipeline(Pipeline):
         Args:
             text: The teaser text to analyze (sent only once)
             blocks_to_process: List of tuples containing (block_id, block_name, block_description)
+            on_section: Optional coroutine called with (block_id, content) for every
+                        section as soon as it is received
             
         Returns:
             Dict[str, str]: Dictionary mapping block_ids to their analysis results
+            
+        Raises:
+            TransientPipelineError: If the request was rate limited or failed on the way
         """
         if not self.openai_api_key or not blocks_to_process:
             return {}
@@ -276,7 +532,7 @@ I'll now ask you to analyze specific sections of this document one by one.
             }
             
             payload = {
-                "model": "gpt-4-turbo",
+                "model": OPENAI_MODEL,
                 "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": initial_message},
@@ -291,35 +547,25 @@ I'll now ask you to analyze specific sections of this document one by one.
             print(f"Payload contains {sum(len(msg['content']) for msg in payload['messages'])} characters of context and instructions")
             print(f"Max tokens set to {payload['max_tokens']}")
             
+            # Create a mapping of section names to block IDs for easy lookup
+            section_name_to_block_id = {name: block_id for block_id, name, _ in blocks_to_process}
+            
             # Call the OpenAI API
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.post(
-                        "https://api.openai.com/v1/chat/completions",
-                        headers=headers,
-                        json=payload,
-                        timeout=180  # Increased timeout for batch processing
-                    ) as response:
-                        if response.status != 200:
-                            error_text = await response.text()
-                            print(f"Error from OpenAI API for batched analysis: Status {response.status}, Response: {error_text}")
-                            return {}
-                            
-                        response_data = await response.json()
-                        
-                except aiohttp.ClientError as e:
-                    print(f"Network error when calling OpenAI API for batched analysis: {str(e)}")
-                    return {}
-                except Exception as e:
-                    print(f"Unexpected error in API call for batched analysis: {str(e)}")
+            if OPENAI_STREAM:
+                full_response = await self._stream_sections_from_gpt(
+                    headers, payload, section_name_to_block_id, results, on_section
+                )
+                if full_response is None:
+                    return results
+            else:
+                full_response = await self._request_completion_from_gpt(headers, payload)
+                if full_response is None:
                     return {}
             
-            # Extract and parse the response
-            full_response = response_data['choices'][0]['message']['content']
             print(f"Received response of {len(full_response)} characters")
             
             # Debugging: Save the full response to a file to examine it
-            debug_file = f"reports/gpt_response_debug_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+            debug_file = f"reports/gpt_response_debug_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.txt"
             with open(debug_file, "w") as f:
                 f.write("REQUESTED BLOCKS:\n")
                 for block_id, block_name, block_desc in blocks_to_process:
@@ -329,52 +575,198 @@ I'll now ask you to analyze specific sections of this document one by one.
                 
             print(f"Debug file saved to {debug_file}")
             
-            # IMPROVED SECTION EXTRACTION:
-            # Split the response by section markers directly
-            section_splits = full_response.split("---SECTION: ")
-            
-            # The first split will be empty or contain non-section text, so skip it
-            section_splits = section_splits[1:] if section_splits else []
-            
-            print(f"Found {len(section_splits)} sections in the GPT response")
-            
-            # Create a mapping of section names to block IDs for easy lookup
-            section_name_to_block_id = {name: block_id for block_id, name, _ in blocks_to_process}
-            
-            # Process each section
-            for section_text in section_splits:
-                # Extract the section name and content
-                section_parts = section_text.split("---", 1)
-                if not section_parts:
-                    continue
+            if not OPENAI_STREAM:
+                # IMPROVED SECTION EXTRACTION:
+                # Split the response by section markers directly
+                section_splits = full_response.split(SECTION_MARKER)
                 
-                # First part has the section name
-                section_name_part = section_parts[0].strip()
-                # Remove trailing dashes if they exist
-                section_name = section_name_part.rstrip("-").strip()
+                # The first split will be empty or contain non-section text, so skip it
+                section_splits = section_splits[1:] if section_splits else []
                 
-                # The rest is the content
-                content = section_parts[1].strip() if len(section_parts) > 1 else section_text
+                print(f"Found {len(section_splits)} sections in the GPT response")
                 
-                # Find the block_id for this section name
-                block_id = section_name_to_block_id.get(section_name)
-                if block_id:
-                    results[block_id] = content
-                    print(f"✅ Stored analysis for '{section_name}' ({len(content)} chars)")
-                else:
-                    print(f"⚠️ Could not find block_id for section '{section_name}'")
-                    # Try a fuzzy match
-                    for name, id in section_name_to_block_id.items():
-                        if section_name.lower() in name.lower() or name.lower() in section_name.lower():
-                            results[id] = content
-                            print(f"📌 Fuzzy matched section '{section_name}' to block '{name}'")
-                            break
+                # Process each section
+                for section_text in section_splits:
+                    block_id, content = self._parse_section(section_text, section_name_to_block_id)
+                    if block_id:
+                        results[block_id] = content
+                        if on_section and content:
+                            await on_section(block_id, content)
             
             print(f"Successfully extracted {len(results)} out of {len(blocks_to_process)} requested sections")
             return results
             
+        except TransientPipelineError:
+            raise
         except Exception as e:
             print(f"Error in batch GPT analysis: {str(e)}")
             import traceback
             traceback.print_exc()
-            return results
\ No newline at end of file
+            return results
+
+    async def _request_completion_from_gpt(self, headers: Dict[str, str], payload: Dict[str, Any]) -> Optional[str]:
+        """
+        Send a chat completion request and return the full response text, or None on failure.
+        Rate limits, server errors and network errors raise TransientPipelineError.
+        """
+        client = self.http_client or OpenAIHTTPClient()
+        try:
+            async with client.post(
+                "https://api.openai.com/v1/chat/completions",
+                headers=headers,
+                json=payload,
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    print(f"Error from OpenAI API for batched analysis: Status {response.status}, Response: {error_text}")
+                    self._raise_if_transient(response.status)
+                    return None
+                    
+                response_data = await response.json()
+                
+        except TransientPipelineError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Network error when calling OpenAI API for batched analysis: {str(e)}")
+            raise TransientPipelineError(f"OpenAI request failed: {e}") from e
+        except Exception as e:
+            print(f"Unexpected error in API call for batched analysis: {str(e)}")
+            return None
+        finally:
+            if client is not self.http_client:
+                await client.close()
+        
+        return response_data['choices'][0]['message']['content']
+
+    async def _stream_sections_from_gpt(
+        self,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        section_name_to_block_id: Dict[str, str],
+        results: Dict[str, str],
+        on_section: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ) -> Optional[str]:
+        """
+        Stream a chat completion (server-sent events) and parse sections as they
+        complete. Each finished section is stored in results and handed to
+        on_section immediately, so sections received before a failure are kept.
+        
+        Returns:
+            Optional[str]: The full response text, or None if the request failed
+            
+        Raises:
+            TransientPipelineError: If the request was rate limited or the stream broke off
+        """
+        payload = {**payload, "stream": True}
+        # Only bound the gap between chunks, not the whole (long) response
+        timeout = aiohttp.ClientTimeout(total=None, connect=OPENAI_CONNECT_TIMEOUT, sock_read=OPENAI_STREAM_READ_TIMEOUT)
+        
+        full_response = ""
+        parsed_up_to = 0
+        
+        async def emit_section(section_text: str):
+            block_id, content = self._parse_section(section_text, section_name_to_block_id)
+            if block_id and content:
+                results[block_id] = content
+                if on_section:
+                    await on_section(block_id, content)
+        
+        client = self.http_client or OpenAIHTTPClient()
+        try:
+            async with client.post(
+                "https://api.openai.com/v1/chat/completions",
+                headers=headers,
+                json=payload,
+                timeout=timeout,
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    print(f"Error from OpenAI API for streamed analysis: Status {response.status}, Response: {error_text}")
+                    self._raise_if_transient(response.status)
+                    return None
+                
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if not delta:
+                        continue
+                    full_response += delta
+                    
+                    # A section is complete once the marker of the next one has arrived
+                    markers = self._find_section_markers(full_response, parsed_up_to)
+                    for start, next_start in zip(markers, markers[1:]):
+                        await emit_section(full_response[start + len(SECTION_MARKER):next_start])
+                    if len(markers) > 1:
+                        parsed_up_to = markers[-1]
+            
+            # The last section ends with the response
+            markers = self._find_section_markers(full_response, parsed_up_to)
+            if markers:
+                await emit_section(full_response[markers[0] + len(SECTION_MARKER):])
+            return full_response
+        
+        except aiohttp.ClientError as e:
+            print(f"Network error while streaming from OpenAI API, keeping {len(results)} finished sections: {str(e)}")
+            raise TransientPipelineError(f"OpenAI stream failed: {e}") from e
+        except asyncio.TimeoutError as e:
+            print(f"Timeout while streaming from OpenAI API, keeping {len(results)} finished sections")
+            raise TransientPipelineError("OpenAI stream timed out") from e
+        finally:
+            if client is not self.http_client:
+                await client.close()
+
+    @staticmethod
+    def _raise_if_transient(status: int):
+        """Raise TransientPipelineError for responses worth retrying later"""
+        if status == 429 or status >= 500:
+            raise TransientPipelineError(f"OpenAI API returned status {status}")
+
+    @staticmethod
+    def _find_section_markers(text: str, start: int) -> List[int]:
+        """Return the positions of all section markers in text from start onwards"""
+        positions = []
+        position = text.find(SECTION_MARKER, start)
+        while position != -1:
+            positions.append(position)
+            position = text.find(SECTION_MARKER, position + len(SECTION_MARKER))
+        return positions
+
+    @staticmethod
+    def _parse_section(section_text: str, section_name_to_block_id: Dict[str, str]) -> Tuple[Optional[str], str]:
+        """
+        Split a section (the text following a section marker) into its name and
+        content and resolve the name to a block ID.
+        
+        Returns:
+            Tuple[Optional[str], str]: The block ID (None if unknown) and the section content
+        """
+        # Extract the section name and content
+        section_parts = section_text.split("---", 1)
+        
+        # First part has the section name
+        section_name_part = section_parts[0].strip()
+        # Remove trailing dashes if they exist
+        section_name = section_name_part.rstrip("-").strip()
+        
+        # The rest is the content
+        content = section_parts[1].strip() if len(section_parts) > 1 else section_text
+        
+        # Find the block_id for this section name
+        block_id = section_name_to_block_id.get(section_name)
+        if block_id:
+            print(f"✅ Stored analysis for '{section_name}' ({len(content)} chars)")
+            return block_id, content
+        
+        print(f"⚠️ Could not find block_id for section '{section_name}'")
+        # Try a fuzzy match
+        for name, id in section_name_to_block_id.items():
+            if section_name.lower() in name.lower() or name.lower() in section_name.lower():
+                print(f"📌 Fuzzy matched section '{section_name}' to block '{name}'")
+                return id, content
+        return None, content
@@ -0,0 +1,96 @@
+"""
+Live progress of teaser processing.
+
+Workers publish stage transitions on a per-teaser redis channel; the API
+relays them to clients as server-sent events. The latest event of every
+teaser is also kept in a key so that late subscribers start from the
+current stage.
+"""
+
+import json
+import os
+import time
+from typing import AsyncIterator, Optional
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+# How long the latest event of a teaser is kept around
+PROGRESS_TTL_SECONDS = int(os.getenv("PROGRESS_TTL_SECONDS", "86400"))
+# Interval of keep-alive comments on idle event streams
+PROGRESS_KEEPALIVE_SECONDS = float(os.getenv("PROGRESS_KEEPALIVE_SECONDS", "15"))
+
+# Stages after which no further events are published for a run
+TERMINAL_STAGES = {"completed", "error", "cancelled"}
+
+_redis: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.from_url(REDIS_URL)
+    return _redis
+
+
+def _channel(teaser_id: int) -> str:
+    return f"teaser:{teaser_id}:events"
+
+
+def _latest_key(teaser_id: int) -> str:
+    return f"teaser:{teaser_id}:latest_event"
+
+
+async def publish_progress(teaser_id: int, stage: str, **data):
+    """
+    Publish a stage transition of a teaser. Failures are logged and swallowed,
+    progress reporting must never break processing.
+    """
+    event = {"teaser_id": teaser_id, "stage": stage, "timestamp": time.time(), **data}
+    message = json.dumps(event)
+    try:
+        client = get_redis()
+        await client.set(_latest_key(teaser_id), message, ex=PROGRESS_TTL_SECONDS)
+        await client.publish(_channel(teaser_id), message)
+    except Exception as e:
+        print(f"Could not publish progress for teaser {teaser_id}: {e}")
+
+
+def _format_event(message: str) -> str:
+    return f"data: {message}\n\n"
+
+
+async def stream_progress(teaser_id: int, request=None) -> AsyncIterator[str]:
+    """
+    Yield server-sent events for a teaser until it reaches a terminal stage
+    or the client disconnects.
+    """
+    pubsub = get_redis().pubsub()
+    await pubsub.subscribe(_channel(teaser_id))
+    try:
+        # Start with the latest known stage
+        latest = await get_redis().get(_latest_key(teaser_id))
+        if latest:
+            latest = latest.decode("utf-8")
+            yield _format_event(latest)
+            if json.loads(latest)["stage"] in TERMINAL_STAGES:
+                return
+
+        while True:
+            if request is not None and await request.is_disconnected():
+                return
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=PROGRESS_KEEPALIVE_SECONDS)
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            data = message["data"].decode("utf-8")
+            yield _format_event(data)
+            if json.loads(data)["stage"] in TERMINAL_STAGES:
+                return
+    finally:
+        await pubsub.unsubscribe(_channel(teaser_id))
+        await pubsub.close()
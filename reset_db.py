@@ -1,18 +1,18 @@
 """
 Script to reset the database tables
-This will delete all existing data and recreate the tables with the new schema.
+This will delete all existing data and recreate the tables by running all
+migrations down to an empty database and back up to the latest revision.
 """
 
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from models import Base
-from database import engine
+from alembic import command
+from alembic.config import Config
+
+config = Config("alembic.ini")
 
 # Drop all tables
-Base.metadata.drop_all(bind=engine)
+command.downgrade(config, "base")
 
 # Create all tables
-Base.metadata.create_all(bind=engine)
+command.upgrade(config, "head")
 
-print("Database has been reset successfully!")
\ No newline at end of file
+print("Database has been reset successfully!")
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Dict, List, Optional, Any
+from pydantic import BaseModel, ConfigDict, create_model
+from typing import Dict, List, Optional, Any, Tuple, Type
+from functools import lru_cache
 from datetime import datetime
 from enum import Enum
 
@@ -8,6 +9,7 @@ class TeaserStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     ERROR = "error"
+    CANCELLED = "cancelled"
 
 class TeaserBase(BaseModel):
     filename: str
@@ -23,6 +25,7 @@ class Entity(BaseModel):
 
 class TeaserResponse(TeaserBase):
     id: int
+    content_hash: Optional[str] = None
     extracted_text: Optional[str] = None
     entities: Optional[Dict[str, List[Entity]]] = None
     gpt_analysis: Optional[Dict[str, Any]] = None
@@ -34,8 +37,46 @@ class TeaserResponse(TeaserBase):
         orm_mode = True
         from_attributes = True
 
+# Fields of TeaserResponse that can be requested individually
+TEASER_FIELDS = tuple(TeaserResponse.model_fields)
+
+def parse_teaser_fields(fields: str) -> Tuple[str, ...]:
+    """
+    Parse a comma-separated list of TeaserResponse fields. The id is always
+    included. Raises ValueError for unknown fields.
+    """
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected - set(TEASER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    selected.add("id")
+    return tuple(field for field in TEASER_FIELDS if field in selected)
+
+@lru_cache(maxsize=None)
+def teaser_fields_model(fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """
+    Build (once per combination) a response model with only the given
+    TeaserResponse fields
+    """
+    return create_model(
+        f"TeaserResponse_{'_'.join(fields)}",
+        __config__=ConfigDict(from_attributes=True),
+        **{field: (TeaserResponse.model_fields[field].annotation, TeaserResponse.model_fields[field]) for field in fields}
+    )
+
+class TeaserListItem(TeaserBase):
+    id: int
+    status: TeaserStatus = TeaserStatus.PENDING
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        orm_mode = True
+        from_attributes = True
+
 class TeaserList(BaseModel):
-    teasers: List[TeaserResponse]
+    teasers: List[TeaserListItem]
+    next_cursor: Optional[str] = None
 
 class TeaserProcessRequest(BaseModel):
     building_blocks: List[str]
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""
+Storage of uploaded teaser PDFs, shared between the API and the workers.
+"""
+
+import os
+
+import aiofiles
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Directory shared between the API and the workers for uploaded PDFs
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+
+
+def upload_path(teaser_id: int) -> str:
+    """Return the path where the uploaded PDF of a teaser is stored"""
+    return os.path.join(UPLOAD_DIR, f"{teaser_id}.pdf")
+
+
+async def save_upload(teaser_id: int, file_content: bytes) -> str:
+    """Persist an uploaded PDF so that a worker can pick it up"""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = upload_path(teaser_id)
+    async with aiofiles.open(path, "wb") as f:
+        await f.write(file_content)
+    return path
+
+
+async def read_upload(teaser_id: int) -> bytes:
+    """Read the uploaded PDF of a teaser"""
+    async with aiofiles.open(upload_path(teaser_id), "rb") as f:
+        return await f.read()
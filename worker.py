@@ -0,0 +1,156 @@
+"""
+Celery worker tier for teaser processing.
+
+The API only records the teaser and enqueues a job (see jobs.py); text
+extraction, NER, GPT analysis and report generation all run here, out of the
+API process.
+
+Start one or more workers (on any number of hosts sharing the broker, the
+database and the upload/report directories) with:
+
+    celery -A worker.celery_app worker --loglevel=info
+"""
+
+import asyncio
+import threading
+from typing import List, Optional
+
+from celery import Task
+from celery.signals import worker_ready, worker_shutdown
+from dotenv import load_dotenv
+from sqlalchemy.exc import OperationalError
+
+from database import SessionLocal, engine
+from jobs import CELERY_MAX_RETRIES, PROCESS_TEASER_TASK, celery_app
+from parser.pdf_parser import shutdown_executors
+from parser.nlp import preload_ner_workers, shutdown_ner_executor
+from pipeline.http_client import OpenAIHTTPClient
+from pipeline.base import TransientPipelineError
+from pipeline.simple_openai.teaser_pipeline import SimpleOpenAIPipeline
+from cancellation import CancellationRegistry
+
+# Load environment variables
+load_dotenv()
+
+# Pooled OpenAI client shared by every job of this worker process
+http_client = OpenAIHTTPClient()
+
+
+@worker_ready.connect
+def _preload_models(**kwargs):
+    # Load the spaCy model in the NER processes before the first teaser arrives
+    preload_ner_workers()
+    # Report the OpenAI pool utilisation of this worker in the background
+    asyncio.run_coroutine_threadsafe(http_client.log_stats_periodically(), get_loop())
+
+
+@worker_shutdown.connect
+def _shutdown_pools(**kwargs):
+    shutdown_executors()
+    shutdown_ner_executor()
+    if _loop is not None:
+        run_async(http_client.close())
+        run_async(engine.dispose())
+
+
+# A single event loop per worker process, shared by all worker threads
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the worker's event loop, starting it on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="pipeline-loop", daemon=True).start()
+    return _loop
+
+
+def run_async(coro):
+    """Run a coroutine on the worker's event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+
+def get_pipeline() -> SimpleOpenAIPipeline:
+    return SimpleOpenAIPipeline(SessionLocal, http_client=http_client)
+
+
+async def process_teaser(
+    teaser_id: int,
+    selected_blocks: Optional[List[str]] = None,
+    restart_from: Optional[str] = None,
+    run_id: Optional[str] = None
+):
+    """
+    Run a teaser through the pipeline, resuming after its last checkpointed stage
+    """
+    await get_pipeline().process(teaser_id, selected_blocks, restart_from, run_id)
+
+
+# Pipeline tasks running in this worker process, by teaser id
+cancellation_registry = CancellationRegistry()
+
+
+async def run_cancellable(teaser_id: int, run_id: Optional[str], coro):
+    """
+    Run a job as a task that cancelling its run can cancel. Jobs whose run
+    was cancelled or replaced by a newer one while they were queued are
+    skipped.
+    """
+    cancellation_registry.ensure_listening()
+    pipeline = get_pipeline()
+    if not await pipeline.is_current_run(teaser_id, run_id):
+        coro.close()
+        print(f"Run {run_id} of teaser {teaser_id} was cancelled or replaced before it started, skipping")
+        return
+
+    task = asyncio.ensure_future(coro)
+    cancellation_registry.register(teaser_id, run_id, task)
+    try:
+        # The run may have been cancelled before the listener subscribed
+        if not await pipeline.is_current_run(teaser_id, run_id):
+            task.cancel()
+        await task
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise
+        print(f"Processing of teaser {teaser_id} was cancelled")
+    finally:
+        cancellation_registry.unregister(teaser_id, task)
+
+
+class PipelineTask(Task):
+    """
+    Task that marks its teaser as failed once it has given up, i.e. when
+    retries are exhausted or the error isn't retryable. Until then a failed
+    job leaves the teaser in processing and the retry resumes from the last
+    checkpoint.
+    """
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        # Jobs queued before run tokens were introduced have no run_id
+        run_id = args[3] if len(args) > 3 else kwargs.get("run_id")
+        run_async(get_pipeline().mark_failed(args[0], str(exc), run_id))
+
+
+@celery_app.task(
+    name=PROCESS_TEASER_TASK,
+    bind=True,
+    base=PipelineTask,
+    autoretry_for=(OperationalError, TransientPipelineError),
+    retry_backoff=True,
+    max_retries=CELERY_MAX_RETRIES,
+)
+def process_teaser_task(
+    self,
+    teaser_id: int,
+    selected_blocks: Optional[List[str]] = None,
+    restart_from: Optional[str] = None,
+    run_id: Optional[str] = None
+):
+    # A retry resumes where the failed attempt stopped instead of restarting again
+    if self.request.retries:
+        restart_from = None
+    run_async(run_cancellable(teaser_id, run_id, process_teaser(teaser_id, selected_blocks, restart_from, run_id)))